@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os.path
+import sys
+import shutil
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paster.utils import as_config, clear_config_cache
+from paster.wsgi import load_config
+
+__author__ = 'terry'
+
+
+def make_setting(path, sections=200, options=10):
+    with open(path, 'w') as f:
+        f.write('[DEFAULT]\nlog_level = INFO\n')
+        for i in range(sections):
+            f.write('\n[m{0}]\n'.format(i))
+            for j in range(options):
+                f.write('option_{0} = value_{1}_{0}\n'.format(j, i))
+
+
+if __name__ == '__main__':
+    sections = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    here = tempfile.mkdtemp()
+    try:
+        setting = os.path.join(here, 'setting.ini')
+        make_setting(setting, sections)
+        local_conf = dict([('m{0}'.format(i), 'config:normal:setting.ini:m{0}'.format(i)) for i in range(20)])
+
+        def cold():
+            clear_config_cache()
+            as_config(setting)
+            load_config(local_conf, here)
+
+        def warm():
+            as_config(setting)
+            load_config(local_conf, here)
+
+        warm()
+        print('{0:>8} {1:>14}'.format('cache', 'ms/call'))
+        for title, func in (('cold', cold), ('warm', warm)):
+            number = 20
+            cost = timeit.timeit(func, number=number)
+            print('{0:>8} {1:>14.4f}'.format(title, cost / number * 1e3))
+    finally:
+        shutil.rmtree(here)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paster.content import JSON_ENCODER_BACKENDS, set_json_encoder, json_encode
+
+__author__ = 'terry'
+
+
+def make_payloads():
+    row = {'id': 1024, 'name': u'server-01', 'status': 'ACTIVE', 'progress': 100,
+           'flavor': {'ram': 2048, 'vcpus': 2, 'disk': 20.5},
+           'addresses': ['10.0.0.1', '10.0.0.2'], 'locked': False, 'metadata': None}
+    return [
+        ('small object', row, 20000),
+        ('list of 1000', [dict(row, id=i) for i in range(1000)], 200),
+        ('list of 20000', [dict(row, id=i) for i in range(20000)], 10),
+    ]
+
+
+if __name__ == '__main__':
+    payloads = make_payloads()
+    print('{0:>16} {1:>10} {2:>14}'.format('payload', 'backend', 'ms/op'))
+    for title, payload, number in payloads:
+        for backend in JSON_ENCODER_BACKENDS:
+            if set_json_encoder(backend) != backend:
+                continue
+            cost = timeit.timeit(lambda: json_encode(payload), number=number)
+            print('{0:>16} {1:>10} {2:>14.4f}'.format(title, backend, cost / number * 1e3))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import gc
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paster.wsgi import WSGIMiddleware, Middleware
+
+__author__ = 'terry'
+
+
+APP_NAME = '[bench]'
+MOUNT = '/v1'
+DEPTH = 5
+NUMBER = 50000
+
+
+class PassMiddleware(Middleware, WSGIMiddleware):
+    instances = 0
+
+    def __init__(self, *args, **kwargs):
+        PassMiddleware.instances += 1
+        super(PassMiddleware, self).__init__(*args, **kwargs)
+
+
+def per_request_factory(context, start_response=None):
+    """The chain as it was run before: one middleware object per request and call"""
+    _start_response = start_response
+    _context = type('Response', (), {'content': None, 'status_code': 200})
+    _composite_url = APP_NAME + context['SCRIPT_NAME']
+    for c, _conf, _local_conf, sh in WSGIMiddleware.middleware[_composite_url][::-1]:
+        c = c(sh, _conf, **_local_conf)
+        context, _start_response = c.__call__(context, _start_response)
+    _context.content = context if context else None
+    return _context, _start_response
+
+
+def compiled_factory(context, start_response=None):
+    return WSGIMiddleware._factory(context, start_response, app_name=APP_NAME)
+
+
+def setup():
+    local_name = APP_NAME + MOUNT
+    WSGIMiddleware.middleware[local_name] = [(PassMiddleware, {}, {'option': 'value'}, None)
+                                             for i in range(DEPTH)]
+    WSGIMiddleware.compile_pipeline(local_name)
+
+
+def requests_per_second(factory):
+    environ = {'SCRIPT_NAME': MOUNT}
+    begin = time.time()
+    for i in range(NUMBER):
+        factory(environ)
+    return NUMBER / (time.time() - begin)
+
+
+def allocations_per_request(factory, number=1000):
+    """
+    每个请求新建的中间件实例数, 以及留给循环垃圾回收的对象数
+
+    py2没有tracemalloc, 关闭gc后用gc.get_objects()的数量差统计
+    """
+    environ = {'SCRIPT_NAME': MOUNT}
+    factory(environ)
+    instances = PassMiddleware.instances
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        for i in range(number):
+            factory(environ)
+        after = len(gc.get_objects())
+    finally:
+        gc.enable()
+        gc.collect()
+    return float(PassMiddleware.instances - instances) / number, float(after - before) / number
+
+
+if __name__ == '__main__':
+    setup()
+    print('{0:>12} {1:>12} {2:>20} {3:>16}'.format('chain', 'req/s', 'instances/request', 'gc objs/request'))
+    for title, factory in [('per-request', per_request_factory), ('compiled', compiled_factory)]:
+        instances, objects = allocations_per_request(factory)
+        print('{0:>12} {1:>12.0f} {2:>20.1f} {3:>16.1f}'.format(title, requests_per_second(factory),
+                                                                instances, objects))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os.path
+import sys
+import time
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paster.content import MultipartParser
+
+__author__ = 'terry'
+
+BOUNDARY = '----pasterbenchboundary'
+BLOCK = ('0123456789abcdef' * 4096)
+
+
+class SyntheticUpload(object):
+    """multipart/form-data body generated on the fly, one small field and one file of `size` bytes"""
+
+    def __init__(self, size):
+        self.parts = [
+            '--{0}\r\nContent-Disposition: form-data; name="title"\r\n\r\nbench\r\n'.format(BOUNDARY),
+            '--{0}\r\nContent-Disposition: form-data; name="file"; filename="blob.bin"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'.format(BOUNDARY),
+        ]
+        self.remaining = size
+        self.tail = '\r\n--{0}--\r\n'.format(BOUNDARY)
+        self.pending = ''
+
+    def read(self, size=-1):
+        while len(self.pending) < size:
+            if self.parts:
+                self.pending += self.parts.pop(0)
+            elif self.remaining > 0:
+                block = BLOCK[:self.remaining]
+                self.remaining -= len(block)
+                self.pending += block
+            elif self.tail:
+                self.pending, self.tail = self.pending + self.tail, ''
+            else:
+                break
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2 * 1024 ** 3
+    start = time.time()
+    form = MultipartParser(SyntheticUpload(size), BOUNDARY).parse()
+    cost = time.time() - start
+    upload = form['file']
+    assert upload.size == size, (upload.size, size)
+    upload.close()
+    print('{0:>12} {1:>10} {2:>10} {3:>12}'.format('bytes', 'seconds', 'MB/s', 'peak RSS MB'))
+    print('{0:>12} {1:>10.2f} {2:>10.1f} {3:>12.1f}'.format(size, cost, size / 1048576.0 / cost, peak_rss_mb()))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os.path
+import sys
+import struct
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'paster', 'network'))
+
+from ip import IPv4
+
+__author__ = 'terry'
+
+
+HEADER = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 1400, 1, 0x4000, 64, 6, 0, '\xc0\xa8\x01\x02', '\x0a\x00\x00\x01')
+
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frame = memoryview(bytearray('\x00' * 14 + HEADER))
+    packet = IPv4.force_unpack(frame, 14)
+    buf = bytearray(len(HEADER))
+
+    cases = (
+        ('force_unpack', lambda: IPv4.force_unpack(frame, 14)),
+        ('getitem', lambda: packet['protocol']),
+        ('pack', packet.pack),
+        ('pack_into', lambda: packet.pack_into(buf)),
+    )
+    print('{0:>14} {1:>14}'.format('op', 'us/call'))
+    for title, func in cases:
+        cost = timeit.timeit(func, number=number)
+        print('{0:>14} {1:>14.3f}'.format(title, cost / number * 1e6))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import re
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paster.wsgi import VirtualShell
+
+__author__ = 'terry'
+
+
+ROUTES = [10, 100, 500]
+NUMBER = 20000
+METHOD = 'GETapplication/x-www-form-urlencoded'
+
+
+class Model(object):
+    def handler(self, env, **kwargs):
+        return kwargs
+
+
+def make_shell(count):
+    sh = VirtualShell()
+    sh.hook_objects['bench.Model'] = Model()
+    apis = []
+    for i in range(count):
+        if i % 2:
+            url = '^/resource{0}/(?P<id>\\d+)/detail$'.format(i)
+        else:
+            url = '^/resource{0}/list$'.format(i)
+        apis.append((re.compile(url), ('bench.Model', 'handler')))
+    sh.mapping_api[METHOD] = apis
+    sh.build_index()
+    return sh
+
+
+def linear_lookup(sh, name):
+    for k, m in sh.mapping_api[METHOD]:
+        if k.match(name):
+            return sh._get_method(*m)
+
+
+def indexed_lookup(sh, name):
+    found = sh.route_index[METHOD].lookup(name)
+    target = found[1]
+    _meth = sh.method_cache.get(target)
+    if _meth is None:
+        _meth = sh.method_cache[target] = sh._get_method(*target)
+    return _meth
+
+
+if __name__ == '__main__':
+    print('{0:>8} {1:>12} {2:>14} {3:>14} {4:>8}'.format('routes', 'kind', 'linear us/op', 'index us/op',
+                                                         'speedup'))
+    for count in ROUTES:
+        sh = make_shell(count)
+        # Last registered routes: the worst case for the linear scan
+        for kind, name in [('literal', '/resource{0}/list'.format(count - 2)),
+                           ('pattern', '/resource{0}/42/detail'.format(count - 1))]:
+            assert linear_lookup(sh, name) == indexed_lookup(sh, name)
+            linear = timeit.timeit(lambda: linear_lookup(sh, name), number=NUMBER)
+            indexed = timeit.timeit(lambda: indexed_lookup(sh, name), number=NUMBER)
+            print('{0:>8} {1:>12} {2:>14.3f} {3:>14.3f} {4:>7.1f}x'.format(count, kind,
+                                                                        linear / NUMBER * 1e6,
+                                                                        indexed / NUMBER * 1e6,
+                                                                        linear / indexed))
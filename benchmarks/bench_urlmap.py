@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paster.urlmap import URLMap
+
+__author__ = 'terry'
+
+
+MOUNTS = [10, 100, 1000]
+NUMBER = 20000
+
+
+def linear_match(applications, host, port, path_info):
+    for (domain, app_url), app in applications:
+        if domain and domain != host and domain != host + ':' + port:
+            continue
+        if path_info == app_url or path_info.startswith(app_url + '/'):
+            return app, app_url
+    return None, None
+
+
+def make_map(count):
+    _map = URLMap()
+    for i in range(count):
+        _map['/service{0}/v1'.format(i)] = i
+    _map.build_index()
+    return _map
+
+
+def run(count):
+    _map = make_map(count)
+    # Worst case for the linear scan: the shortest mount sorts last.
+    path_info = '/service0/v1/servers/detail'
+    assert linear_match(_map.applications, 'localhost', '80', path_info) == \
+        _map._match('localhost', '80', path_info)
+    linear = timeit.timeit(lambda: linear_match(_map.applications, 'localhost', '80', path_info),
+                           number=NUMBER)
+    trie = timeit.timeit(lambda: _map._match('localhost', '80', path_info), number=NUMBER)
+    return linear, trie
+
+
+if __name__ == '__main__':
+    print('{0:>8} {1:>14} {2:>14} {3:>8}'.format('mounts', 'linear us/op', 'trie us/op', 'speedup'))
+    for count in MOUNTS:
+        linear, trie = run(count)
+        print('{0:>8} {1:>14.3f} {2:>14.3f} {3:>7.1f}x'.format(count,
+                                                           linear / NUMBER * 1e6,
+                                                           trie / NUMBER * 1e6,
+                                                           linear / trie))
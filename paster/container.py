@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado
+from tornado import escape, gen, httputil
+from tornado.wsgi import WSGIContainer
+
+from utils import myException
+from content import json_encode
+from http import ASYNC_ENVIRON_KEY, DeferredResponse
+from timing import Histogram, clock
+from wsgi import error_content
+from log import get_logger
+
+__author__ = 'terry'
+
+
+logger = get_logger(__name__)
+
+
+class AsyncWSGIContainer(WSGIContainer):
+    """
+    在IOLoop上等待协程处理器的WSGI容器, 同步处理器照常执行, 流式响应体分块写出
+
+    :param wsgi_application: URLMap
+    """
+
+    @gen.coroutine
+    def __call__(self, request):
+        try:
+            yield self._handle(request)
+        except Exception:
+            logger.exception('Uncaught exception serving {0}'.format(request.uri))
+            if not request.connection.stream.closed():
+                request.connection.stream.close()
+
+    @gen.coroutine
+    def _handle(self, request):
+        data = {}
+        response = []
+
+        def start_response(status, response_headers, exc_info=None):
+            data['status'] = status
+            data['headers'] = response_headers
+            return response.append
+
+        environ = WSGIContainer.environ(request)
+        environ[ASYNC_ENVIRON_KEY] = True
+        app_response = self.wsgi_application(environ, start_response)
+        if isinstance(app_response, DeferredResponse):
+            try:
+                value = yield app_response.awaitable
+            except Exception as e:
+                app_response = app_response.render(None, e)
+            else:
+                app_response = app_response.render(value)
+
+        try:
+            if isinstance(app_response, (basestring, list, tuple)):
+                response.extend([app_response] if isinstance(app_response, basestring) else app_response)
+                yield self._write(request, data, ''.join(response))
+            else:
+                yield self._write_chunks(request, data, response, app_response)
+        finally:
+            if hasattr(app_response, 'close'):
+                app_response.close()
+
+    @staticmethod
+    def _start_line(data, headers, body=None):
+        if not data:
+            raise Exception('WSGI app did not call start_response')
+        status_code, reason = data['status'].split(' ', 1)
+        status_code = int(status_code)
+        header_set = set(k.lower() for k, v in headers)
+        if body is not None and status_code != 304 and 'content-length' not in header_set:
+            headers.append(('Content-Length', str(len(body))))
+        if 'content-type' not in header_set:
+            headers.append(('Content-Type', 'text/html; charset=UTF-8'))
+        if 'server' not in header_set:
+            headers.append(('Server', 'TornadoServer/{0}'.format(tornado.version)))
+        header_obj = httputil.HTTPHeaders()
+        for key, value in headers:
+            header_obj.add(key, value)
+        return httputil.ResponseStartLine('HTTP/1.1', status_code, reason), header_obj, status_code
+
+    @gen.coroutine
+    def _write(self, request, data, body):
+        body = escape.utf8(body)
+        start_line, headers, status_code = self._start_line(data, data.get('headers', []), body)
+        yield request.connection.write_headers(start_line, headers, chunk=body)
+        request.connection.finish()
+        self._log(status_code, request)
+
+    @gen.coroutine
+    def _write_chunks(self, request, data, response, app_response):
+        # Chunked transfer, each chunk waits for the socket to drain
+        iterator = iter(app_response)
+        first = ''.join(response)
+        if not first:
+            first = yield self._next_chunk(iterator)
+        start_line, headers, status_code = self._start_line(data, data.get('headers', []))
+        yield request.connection.write_headers(start_line, headers, chunk=escape.utf8(first) if first else None)
+        while True:
+            chunk = yield self._next_chunk(iterator)
+            if chunk is None:
+                break
+            if chunk:
+                yield request.connection.write(escape.utf8(chunk))
+        request.connection.finish()
+        self._log(status_code, request)
+
+    def _next_chunk(self, iterator):
+        """Next chunk of the response body, None when it is exhausted"""
+        return gen.maybe_future(next(iterator, None))
+
+    @gen.coroutine
+    def _write_error(self, request, err, headers=()):
+        data = {'status': '{0} Oops'.format(err.status_code),
+                'headers': [('CONTENT-TYPE', 'application/json')] + list(headers)}
+        yield self._write(request, data, json_encode(error_content(err)))
+
+
+class ServiceUnavailable(myException):
+    """Raised when the worker queue of an executor container is full"""
+
+    status_code = 503
+    error_code = 5003
+
+
+POOL_SIZE = 16
+QUEUE_SIZE = 64
+
+
+class QueueStats(object):
+    def __init__(self):
+        self.wait = Histogram()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def observe(self, wait):
+        with self.lock:
+            self.wait.observe(wait)
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+
+    def to_dict(self):
+        with self.lock:
+            return dict(wait=self.wait.to_dict(), rejected=self.rejected)
+
+
+QUEUE_STATS = {}
+
+
+def get_queue_stats():
+    return dict([(str(name), stats.to_dict()) for name, stats in QUEUE_STATS.items()])
+
+
+def queue_stats_app(environ, start_response):
+    """WSGI application reporting queue wait histograms of the executor containers"""
+    start_response('200 OK', [('CONTENT-TYPE', 'application/json')])
+    return [json_encode(get_queue_stats())]
+
+
+class ExecutorWSGIContainer(AsyncWSGIContainer):
+    """
+    在有界线程池中执行阻塞的WSGI应用, 排队请求超过queue_size时直接返回503
+
+    流式响应体的每一块也在线程池中读取, 请求直到响应体写完或关闭才从排队数中移除, 慢速流同样受pool_size + queue_size限制
+
+    :param wsgi_application: URLMap
+    :param pool_size: 工作线程数
+    :param queue_size: 最大排队请求数
+    :param name: 队列统计名
+    """
+
+    def __init__(self, wsgi_application, pool_size=POOL_SIZE, queue_size=QUEUE_SIZE, name=None):
+        super(ExecutorWSGIContainer, self).__init__(wsgi_application)
+        self.pool_size = int(pool_size)
+        self.queue_size = int(queue_size)
+        self.executor = ThreadPoolExecutor(self.pool_size)
+        # Only touched on the IOLoop thread
+        self.pending = 0
+        self.stats = QUEUE_STATS[name or id(self)] = QueueStats()
+
+    @gen.coroutine
+    def _handle(self, request):
+        if self.pending >= self.pool_size + self.queue_size:
+            self.stats.reject()
+            yield self._write_error(request, ServiceUnavailable('Server is busy, try again later'),
+                                    [('Retry-After', '1')])
+            return
+        environ = WSGIContainer.environ(request)
+        # A request stays pending until its body is written, streamed bodies keep pulling chunks on the pool
+        self.pending += 1
+        try:
+            try:
+                data, response, app_response = yield self.executor.submit(self._run, environ, clock())
+            except Exception as e:
+                logger.exception('Uncaught exception serving {0}'.format(request.uri))
+                err = e if isinstance(e, myException) else myException(str(e))
+                yield self._write_error(request, err)
+                return
+            if app_response is None:
+                yield self._write(request, data, ''.join(response))
+                return
+            try:
+                yield self._write_chunks(request, data, response, app_response)
+            finally:
+                if hasattr(app_response, 'close'):
+                    app_response.close()
+        finally:
+            self.pending -= 1
+
+    def _next_chunk(self, iterator):
+        # Streamed bodies may block while producing chunks, pull them on the pool too
+        return self.executor.submit(next, iterator, None)
+
+    def _run(self, environ, queued):
+        """
+        在工作线程中执行应用, 列表或字符串响应体直接拼接, 其他可迭代响应体原样返回由IOLoop分块写出
+
+        :return: (状态和响应头, 已拼接的响应体, 未消费的响应体或None)
+        """
+        self.stats.observe(clock() - queued)
+        data, response = {}, []
+
+        def start_response(status, response_headers, exc_info=None):
+            data['status'] = status
+            data['headers'] = response_headers
+            return response.append
+
+        app_response = self.wsgi_application(environ, start_response)
+        if not isinstance(app_response, (basestring, list, tuple)):
+            return data, response, app_response
+        response.extend([app_response] if isinstance(app_response, basestring) else app_response)
+        if hasattr(app_response, 'close'):
+            app_response.close()
+        return data, [escape.utf8(chunk) for chunk in response], None
+
+
+CONTAINERS = {
+    'wsgi': WSGIContainer,
+    'async': AsyncWSGIContainer,
+    'executor': ExecutorWSGIContainer,
+}
+
+DEFAULT_CONTAINER = 'async'
+
+
+def make_container(app, service_conf=None):
+    """
+    按[service:]中的container选项创建Tornado容器, executor容器读取pool_size和queue_size
+
+    默认使用async容器, StreamBody等流式响应体分块写出. wsgi为Tornado自带的WSGIContainer, 会把响应体全部读入内存
+
+    :param app: WSGI应用
+    :param service_conf: 服务配置
+    :return:
+    """
+    service_conf = service_conf or {}
+    name = service_conf.get('container', DEFAULT_CONTAINER)
+    if name not in CONTAINERS:
+        raise ValueError('Unknown container {0}, expected one of {1}'.format(name, ', '.join(sorted(CONTAINERS))))
+    if name == 'executor':
+        return ExecutorWSGIContainer(app,
+                                     pool_size=service_conf.get('pool_size', POOL_SIZE),
+                                     queue_size=service_conf.get('queue_size', QUEUE_SIZE),
+                                     name='{0}:{1}'.format(service_conf.get('address'), service_conf.get('port')))
+    return CONTAINERS[name](app)
@@ -17,17 +17,49 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import cgi
 import json
+import tempfile
+import urlparse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2 as cbor
+except ImportError:
+    try:
+        import cbor
+    except ImportError:
+        cbor = None
+
+from utils import myException
+from log import get_logger
 
 __author__ = 'terry'
 
 
+logger = get_logger(__name__)
+
+
 CONTENT_TYPE_X_WWW_FORM_URLENCODED = 'application/x-www-form-urlencoded'
 CONTENT_TYPE_MULTI_FORM_DATA = 'multipart/form-data'
 CONTENT_TYPE_JSON = 'application/json'
 CONTENT_TYPE_PLAIN = 'text/plain'
+CONTENT_TYPE_MSGPACK = 'application/msgpack'
+CONTENT_TYPE_X_MSGPACK = 'application/x-msgpack'
+CONTENT_TYPE_CBOR = 'application/cbor'
 
+# Request body decoders and response encoders, keyed by MIME type
 CONTENT_PROCESS = {}
+CONTENT_ENCODER = {}
+
+# Backends tried in order when json_encoder is set to 'auto'
+JSON_ENCODER_BACKENDS = ['ujson', 'json']
+
+JSON_ENCODER = {'name': 'json', 'dumps': json.dumps}
 
 
 def get_default_content_type():
@@ -38,18 +70,349 @@ def get_content_process():
     return CONTENT_PROCESS
 
 
+def _load_json_encoder(name):
+    if name == 'json':
+        return json.dumps
+    elif name == 'ujson':
+        import ujson
+        return ujson.dumps
+    raise ValueError('Unknown json encoder {0}'.format(name))
+
+
+def set_json_encoder(name=None):
+    """
+    选择JSON编码后端, 未安装时回退到标准库
+
+    :param name: json, ujson 或 auto
+    :return: 实际使用的后端名
+    """
+    name = str(name).strip().lower() if name else 'json'
+    names = JSON_ENCODER_BACKENDS if name == 'auto' else [name]
+    for _name in names:
+        try:
+            dumps = _load_json_encoder(_name)
+        except (ImportError, ValueError) as e:
+            logger.warning('JSON encoder {0} is unavailable: {1}'.format(_name, e))
+            continue
+        JSON_ENCODER.update(name=_name, dumps=dumps)
+        return _name
+    JSON_ENCODER.update(name='json', dumps=json.dumps)
+    return 'json'
+
+
+def get_json_encoder():
+    return JSON_ENCODER['name']
+
+
+def json_encode(obj, ensure_ascii=True):
+    """
+    用配置的后端编码JSON
+
+    :param obj: 对象
+    :param ensure_ascii: 为False时非ASCII字符不转义
+    :return:
+    """
+    dumps = JSON_ENCODER['dumps']
+    try:
+        return dumps(obj) if ensure_ascii else dumps(obj, ensure_ascii=False)
+    except (TypeError, ValueError, OverflowError):
+        # Fast backends reject some objects the standard library accepts
+        if dumps is json.dumps:
+            raise
+        return json.dumps(obj, ensure_ascii=ensure_ascii)
+
+
+class ContentDecodeError(myException):
+    """Raised when request body can not be decoded by its content-type"""
+
+    status_code = 400
+    error_code = 100
+
+
+def register_content_codec(content_type, decode=None, encode=None):
+    """
+    注册请求体解码器与响应编码器
+
+    :param content_type: MIME类型
+    :param decode: 请求体 -> dict
+    :param encode: 对象 -> 响应体
+    """
+    if decode is not None:
+        CONTENT_PROCESS[content_type] = decode
+    if encode is not None:
+        CONTENT_ENCODER[content_type] = encode
+
+
+def get_content_encoder(content_type):
+    return CONTENT_ENCODER.get(content_type)
+
+
 def content_process_form_urlencoded(body):
+    if body[:1] in ('{', '['):
+        # Clients that omit Content-Type post JSON under the default form type,
+        # a form body such as [a]=1&b=2 is still parsed as a form
+        try:
+            return json.loads(body)
+        except ValueError:
+            pass
+    form = {}
+    for name, value in urlparse.parse_qsl(body, keep_blank_values=True):
+        # Repeated names are collected into a list
+        if name not in form:
+            form[name] = value
+        elif isinstance(form[name], list):
+            form[name].append(value)
+        else:
+            form[name] = [form[name], value]
+    return form
+
+
+def content_process_json(body):
     try:
         return json.loads(body)
-    except:
-        return {}
+    except ValueError as e:
+        raise ContentDecodeError('Malformed JSON body: {0}'.format(e))
+
+
+register_content_codec(CONTENT_TYPE_X_WWW_FORM_URLENCODED, content_process_form_urlencoded)
+register_content_codec(CONTENT_TYPE_JSON, content_process_json, json_encode)
+
+
+if msgpack is not None:
+    def content_process_msgpack(body):
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise ContentDecodeError('Malformed msgpack body: {0}'.format(e))
+
+    def msgpack_encode(obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    register_content_codec(CONTENT_TYPE_MSGPACK, content_process_msgpack, msgpack_encode)
+    register_content_codec(CONTENT_TYPE_X_MSGPACK, content_process_msgpack, msgpack_encode)
+
+
+if cbor is not None:
+    def content_process_cbor(body):
+        try:
+            return cbor.loads(body)
+        except Exception as e:
+            raise ContentDecodeError('Malformed CBOR body: {0}'.format(e))
+
+    register_content_codec(CONTENT_TYPE_CBOR, content_process_cbor, cbor.dumps)
+
+
+MULTIPART_CHUNK_SIZE = 64 * 1024
+MULTIPART_SPOOL_SIZE = 64 * 1024
+MULTIPART_MAX_FIELD_SIZE = 1024 * 1024
+MULTIPART_MAX_HEADER_SIZE = 16 * 1024
+MULTIPART_MAX_PARTS = 1000
+# Bytes held in memory by all fields and unspooled files of one request
+MULTIPART_MAX_MEMORY = 8 * 1024 * 1024
+
+
+class MultipartError(ContentDecodeError):
+    """Raised when multipart/form-data body is malformed"""
+
+
+class MultipartTooLarge(MultipartError):
+    """Raised when multipart/form-data body has too many parts or holds too much in memory"""
+
+    status_code = 413
+    error_code = 114
+
+
+class UploadFile(object):
+    def __init__(self, name, filename, content_type, headers, file):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers
+        self.file = file
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def close(self):
+        self.file.close()
+
+
+class _FieldBuffer(object):
+    def __init__(self, limit, what):
+        self.limit = limit
+        self.what = what
+        self.data = []
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise MultipartError('Multipart {0} exceeds {1} bytes'.format(self.what, self.limit))
+        self.data.append(data)
+
+    def getvalue(self):
+        return ''.join(self.data)
+
+
+class MultipartParser(object):
+    """
+    增量解析multipart/form-data, 按块读取输入流, 文件部分写入临时文件, 内存占用与上传大小无关
+
+    :param stream: 请求体输入流
+    :param boundary: 分隔符
+    :param chunk_size: 每次读取字节数
+    :param spool_size: 文件部分超过该字节数写入磁盘
+    :param max_field_size: 普通字段最大字节数
+    :param tempdir: 临时文件目录
+    :param max_parts: 最多部分数
+    :param max_memory: 所有字段与未写入磁盘的文件合计占用内存上限
+    """
+
+    def __init__(self, stream, boundary, chunk_size=MULTIPART_CHUNK_SIZE, spool_size=MULTIPART_SPOOL_SIZE,
+                 max_field_size=MULTIPART_MAX_FIELD_SIZE, tempdir=None, max_parts=MULTIPART_MAX_PARTS,
+                 max_memory=MULTIPART_MAX_MEMORY):
+        self.stream = stream
+        self.boundary = boundary
+        self.chunk_size = chunk_size
+        self.spool_size = spool_size
+        self.max_field_size = max_field_size
+        self.tempdir = tempdir
+        self.max_parts = max_parts
+        self.max_memory = max_memory
+        self.parts = 0
+        self.memory = 0
+
+    def _charge(self, size):
+        self.memory += size
+        if self.memory > self.max_memory:
+            raise MultipartTooLarge('Multipart body holds more than {0} bytes in memory'.format(self.max_memory))
+
+    def _writer(self, part):
+        """Write to part, counting the bytes it keeps in memory"""
+        if isinstance(part, UploadFile):
+            def write(data):
+                # Only the part below spool_size stays in memory
+                self._charge(min(part.size + len(data), self.spool_size) - min(part.size, self.spool_size))
+                part.write(data)
+        else:
+            def write(data):
+                self._charge(len(data))
+                part.write(data)
+        return write
+
+    def _fill(self, buf, size):
+        while len(buf) < size:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                raise MultipartError('Unexpected end of multipart body')
+            buf += chunk
+        return buf
+
+    def _feed_until(self, buf, marker, write):
+        """Pass everything before marker to write, return what follows it"""
+        keep = len(marker) - 1
+        while True:
+            pos = buf.find(marker)
+            if pos >= 0:
+                if write and pos:
+                    write(buf[:pos])
+                return buf[pos + len(marker):]
+            if len(buf) > keep:
+                if write:
+                    write(buf[:-keep])
+                buf = buf[-keep:]
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                raise MultipartError('Unexpected end of multipart body')
+            buf += chunk
+
+    @staticmethod
+    def _parse_headers(data):
+        headers = {}
+        for line in data.split('\r\n'):
+            if ':' in line:
+                k, v = line.split(':', 1)
+                headers[k.strip().lower()] = v.strip()
+        return headers
+
+    def _new_part(self, headers):
+        self.parts += 1
+        if self.parts > self.max_parts:
+            raise MultipartTooLarge('Multipart body has more than {0} parts'.format(self.max_parts))
+        disposition, params = cgi.parse_header(headers.get('content-disposition', ''))
+        if disposition != 'form-data' or 'name' not in params:
+            raise MultipartError('Multipart part without form-data name')
+        if 'filename' in params:
+            spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size, dir=self.tempdir)
+            return params['name'], UploadFile(params['name'], params['filename'],
+                                              headers.get('content-type', 'application/octet-stream'),
+                                              headers, spool)
+        return params['name'], _FieldBuffer(self.max_field_size, 'field ' + params['name'])
+
+    def parse(self):
+        form = {}
+        try:
+            self._parse(form)
+        except Exception:
+            for value in form.values():
+                for item in (value if isinstance(value, list) else [value]):
+                    if isinstance(item, UploadFile):
+                        item.close()
+            raise
+        return form
+
+    def _parse(self, form):
+        delimiter = '--' + self.boundary
+        buf = self._feed_until('', delimiter, None)
+        while True:
+            buf = self._fill(buf, 2)
+            if buf.startswith('--'):
+                break
+            if not buf.startswith('\r\n'):
+                raise MultipartError('Malformed multipart delimiter')
+            buf = self._fill(buf[2:], 2)
+            if buf.startswith('\r\n'):
+                headers, buf = {}, buf[2:]
+            else:
+                header_buf = _FieldBuffer(MULTIPART_MAX_HEADER_SIZE, 'headers')
+                buf = self._feed_until(buf, '\r\n\r\n', header_buf.write)
+                headers = self._parse_headers(header_buf.getvalue())
+            name, part = self._new_part(headers)
+            try:
+                buf = self._feed_until(buf, '\r\n' + delimiter, self._writer(part))
+            except Exception:
+                if isinstance(part, UploadFile):
+                    part.close()
+                raise
+            if isinstance(part, UploadFile):
+                part.seek(0)
+            else:
+                part = part.getvalue()
+            # Repeated names are collected into a list
+            if name not in form:
+                form[name] = part
+            elif isinstance(form[name], list):
+                form[name].append(part)
+            else:
+                form[name] = [form[name], part]
 
-CONTENT_PROCESS[CONTENT_TYPE_X_WWW_FORM_URLENCODED] = content_process_form_urlencoded
-CONTENT_PROCESS[CONTENT_TYPE_JSON] = content_process_form_urlencoded
 
+def content_process_multi_form_data(stream, options):
+    boundary = options.get('boundary')
+    if not boundary:
+        raise MultipartError('Missing multipart boundary')
+    return MultipartParser(stream, boundary).parse()
 
-def content_process_multi_form_data(body):
-    pass
+# Handed the request stream and Content-Type parameters instead of the whole body
+content_process_multi_form_data.streaming = True
 
 
-CONTENT_PROCESS[CONTENT_TYPE_MULTI_FORM_DATA] = content_process_multi_form_data
+register_content_codec(CONTENT_TYPE_MULTI_FORM_DATA, content_process_multi_form_data)
@@ -18,12 +18,13 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 import pkg_resources
+import sys
 import os.path
 from paste.deploy.compat import unquote
 
 # Object types
 import paste.deploy.loadwsgi
-from paste.deploy.loadwsgi import _ObjectType, _PipeLine, _FilterApp, _App
+from paste.deploy.loadwsgi import _ObjectType, _PipeLine, _FilterApp, _App, _FilterWith
 from paste.deploy.loadwsgi import ConfigLoader, LoaderContext
 from paste.deploy.loadwsgi import loadcontext, fix_call
 from paste.deploy.loadwsgi import FILTER, FILTER_WITH
@@ -33,9 +34,11 @@ from paste.deploy.loadwsgi import _loaders
 
 from paste.deploy.loadwsgi import *
 
+from paster.profiler import startup_span
+
 __author__ = 'terry'
 
-__all__ = ['loadapp', 'loadserver', 'loadfilter', 'appconfig']
+__all__ = ['loadapp', 'loadserver', 'loadfilter', 'appconfig', 'loadservice']
 
 
 class _PIPELINE(_PipeLine):
@@ -125,16 +128,36 @@ class _APP(_App):
             'paste.platform_factory',
             'paste.service_factory',
         ]
-        if context.protocol in supports:
-            return fix_call(context.object,
-                            context.loader, context.global_conf,
-                            **context.local_conf)
-        return super(_APP, self).invoke(context)
+        _name = getattr(context, 'section', None) or getattr(context.object, '__name__', context.protocol)
+        with startup_span('factory', _name):
+            if context.protocol in supports:
+                return fix_call(context.object,
+                                context.loader, context.global_conf,
+                                **context.local_conf)
+            return super(_APP, self).invoke(context)
 
 APP = _APP()
 paste.deploy.loadwsgi.APP = APP
 
 
+class _ServiceApp(_APP):
+    """APP type resolving only [service:] sections by name"""
+    config_prefixes = [['service']]
+
+SERVICE_APP = _ServiceApp()
+
+
+class _FilterWithApp(_FilterWith):
+    """filter-with also wraps the apps SERVICE_APP loads, paste only checks for APP"""
+
+    def invoke(self, context):
+        if isinstance(context.next_context.object_type, _APP):
+            return context.filter_context.create()(context.next_context.create())
+        return super(_FilterWithApp, self).invoke(context)
+
+FILTER_WITH = _FilterWithApp()
+
+
 class _Platform(_ObjectType):
     name = 'platform'
     config_prefixes = [['platform', 'pf']]
@@ -168,6 +191,10 @@ class _ConfigLoader(ConfigLoader):
             return self.model
 
     def get_context(self, object_type, name=None, global_conf=None):
+        with startup_span('section', '{0} {1}'.format(object_type.name, name or 'main')):
+            return self._get_context(object_type, name=name, global_conf=global_conf)
+
+    def _get_context(self, object_type, name=None, global_conf=None):
         if self.absolute_name(name):
             return loadcontext(object_type, name,
                                relative_to=os.path.dirname(self.filename),
@@ -198,7 +225,7 @@ class _ConfigLoader(ConfigLoader):
                 local_conf[option] = self.parser.get(section, option)
         for local_var, glob_var in get_from_globals.items():
             local_conf[local_var] = global_conf[glob_var]
-        if object_type in (APP, FILTER) and 'filter-with' in local_conf:
+        if (object_type is FILTER or isinstance(object_type, _APP)) and 'filter-with' in local_conf:
             filter_with = local_conf.pop('filter-with')
         else:
             filter_with = None
@@ -228,6 +255,9 @@ class _ConfigLoader(ConfigLoader):
                 context = self._context_from_explicit(
                     object_type, local_conf, global_conf, global_additions,
                     section)
+        if isinstance(context, LoaderContext):
+            # Names the factory call in the startup profile
+            context.section = section
         if filter_with is not None:
             filter_with_context = LoaderContext(
                 obj=None,
@@ -354,3 +384,36 @@ def _loadconfig(object_type, uri, path, name, relative_to, global_conf):
     return loader.get_context(object_type, name, global_conf)
 
 _loaders['config'] = _loadconfig
+
+
+def loadservice(uri, name, platform=sys.platform, **kw):
+    """
+    只加载指定的[service:]段及其依赖, 不构建平台中的其他服务
+
+    :param uri: 配置, 如config:setting.ini
+    :param name: 服务名
+    :param platform: 平台段名, 其中的set选项同样生效
+    :return: (应用, 服务配置)
+    """
+    from paster.rpcmap import platform_init
+
+    with startup_span('loadapp', '{0} service:{1}'.format(uri, name), report=True):
+        try:
+            # The [platform:]/[pf:] context carries its set overrides in global_conf
+            context = loadcontext(PLATFORM, uri, name=platform, **kw)
+        except LookupError:
+            context = loadcontext(SERVICE_APP, uri, name=name, **kw)
+            platform_init(context.global_conf)
+            return context.create()
+        # What platform_factory does, for this service only
+        platform_init(context.global_conf)
+        return context.loader.get_context(SERVICE_APP, name, global_conf=context.global_conf).create()
+
+
+_loadapp = loadapp
+
+
+def loadapp(uri, name=None, **kw):
+    """paste.deploy loadapp, profiled when PASTER_PROFILE_STARTUP is set"""
+    with startup_span('loadapp', '{0} {1}'.format(uri, name or 'main'), report=True):
+        return _loadapp(uri, name=name, **kw)
@@ -17,12 +17,337 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import cgi
+import collections
 import os.path
+import tempfile
+import urlparse
+from cStringIO import StringIO
 from zope.mimetype import typegetter
 
+from utils import myException
+from content import get_default_content_type, get_content_process
+
 __author__ = 'terry'
 
 
+CONTENT_TYPE_NDJSON = 'application/x-ndjson'
+
+# Encoded items are joined until a chunk reaches this size before yielding
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def is_stream_content(obj):
+    if isinstance(obj, (basestring, list, tuple, dict)):
+        return False
+    return hasattr(obj, 'next') or hasattr(obj, '__next__')
+
+
+def _to_bytes(data):
+    if isinstance(data, unicode):
+        return data.encode('utf-8')
+    return data
+
+
+class StreamBody(object):
+    """
+    WSGI响应体, 逐项编码迭代器内容, 最多缓存chunk_size字节
+
+    uwsgi以及async, executor容器分块发送; Tornado自带的wsgi容器仍会读完整个响应体
+
+    :param iterator: 处理器返回的迭代器
+    :param encode: 单项编码函数
+    :param prefix: 起始内容
+    :param separator: 分隔内容
+    :param suffix: 结束内容
+    :param chunk_size: 分块大小
+    """
+
+    def __init__(self, iterator, encode, prefix='', separator='', suffix='', chunk_size=STREAM_CHUNK_SIZE):
+        self.iterator = iterator
+        self.encode = encode
+        self.prefix = prefix
+        self.separator = separator
+        self.suffix = suffix
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        buf, size, sep = [self.prefix], len(self.prefix), ''
+        for item in self.iterator:
+            data = _to_bytes(self.encode(item))
+            buf.append(sep)
+            buf.append(data)
+            size += len(sep) + len(data)
+            sep = self.separator
+            if size >= self.chunk_size:
+                yield ''.join(buf)
+                buf, size = [], 0
+        buf.append(self.suffix)
+        chunk = ''.join(buf)
+        if chunk:
+            yield chunk
+
+    def close(self):
+        close = getattr(self.iterator, 'close', None)
+        if callable(close):
+            close()
+
+
+def stream_json_array(iterator, encode):
+    return StreamBody(iterator, encode, prefix='[', separator=',', suffix=']')
+
+
+def stream_ndjson(iterator, encode):
+    return StreamBody(iterator, lambda item: encode(item) + '\n')
+
+
+def stream_raw(iterator, encode):
+    """Strings are sent as is, other items as NDJSON lines"""
+    return StreamBody(iterator, lambda item: item if isinstance(item, basestring) else encode(item) + '\n')
+
+
+REQUEST_ENVIRON_KEY = 'paster.request'
+
+# Environ keys used before the Request view existed, kept as aliases of it
+REQUEST_KWARGS_KEY = 'REQUEST_KWARGS'
+REQUEST_BODY_KEY = 'paster.kwargs'
+
+# Bodies above spool_threshold bytes are spooled to a temporary file,
+# bodies above max_size bytes are refused
+REQUEST_BODY = {'spool_threshold': 1024 * 1024, 'max_size': None}
+
+BODY_READ_SIZE = 64 * 1024
+
+
+class RequestEntityTooLarge(myException):
+    """Raised when request body is bigger than the allowed size"""
+
+    status_code = 413
+    error_code = 113
+
+
+def set_body_limits(spool_threshold=None, max_size=None):
+    """
+    设置请求体缓存阈值和大小上限
+
+    :param spool_threshold: 超过该字节数写入临时文件
+    :param max_size: 允许的最大字节数, 空表示不限制
+    :return:
+    """
+    if spool_threshold:
+        REQUEST_BODY['spool_threshold'] = int(spool_threshold)
+    REQUEST_BODY['max_size'] = int(max_size) if max_size else None
+
+
+class HeaderDict(dict):
+    """Request headers keyed by their lowercase CGI name, e.g. content_type, looked up case-insensitively"""
+
+    @staticmethod
+    def _key(item):
+        return str(item).lower().replace('-', '_')
+
+    def __getitem__(self, item):
+        return super(HeaderDict, self).__getitem__(self._key(item))
+
+    def __setitem__(self, item, value):
+        super(HeaderDict, self).__setitem__(self._key(item), value)
+
+    def __contains__(self, item):
+        return super(HeaderDict, self).__contains__(self._key(item))
+
+    def get(self, item, default=None):
+        return super(HeaderDict, self).get(self._key(item), default)
+
+
+class Request(object):
+    """
+    请求视图, 头部/参数/请求体在首次访问时解析, 由所有中间件和处理器共享
+
+    :param environ: WSGI环境
+    """
+
+    def __init__(self, environ):
+        self.environ = environ
+        self._headers = None
+        self._args = None
+        self._body = None
+        self._stream = None
+        self._form = None
+
+    @property
+    def method(self):
+        return self.environ.get('REQUEST_METHOD', 'GET')
+
+    @property
+    def content_type(self):
+        content_type = self.environ.get('CONTENT_TYPE') or get_default_content_type()
+        return str(content_type).split()[0].strip(';')
+
+    @property
+    def content_options(self):
+        return cgi.parse_header(self.environ.get('CONTENT_TYPE') or '')[1]
+
+    @property
+    def content_length(self):
+        return int(self.environ.get('CONTENT_LENGTH') or 0)
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            headers = HeaderDict()
+            for key, value in self.environ.items():
+                if key.startswith('HTTP_') and len(key) > 5:
+                    headers[key[5:]] = value
+            self._headers = headers
+        return self._headers
+
+    @property
+    def args(self):
+        if self._args is None:
+            args = self.environ.get(REQUEST_KWARGS_KEY)
+            if isinstance(args, dict):
+                # Replaced by a middleware through the old environ key
+                self._args = args
+                return args
+            args = {}
+            for k, v in urlparse.parse_qs(self.environ.get('QUERY_STRING', '')).items():
+                args[k] = v[0]
+            self._args = args
+        return self._args
+
+    def _check_size(self):
+        length = self.content_length
+        max_size = REQUEST_BODY['max_size']
+        if max_size and length > max_size:
+            raise RequestEntityTooLarge('Request body exceeds {0} bytes'.format(max_size))
+        return length
+
+    def _read_body(self):
+        length = self._check_size()
+        read = self.environ['wsgi.input'].read
+        if REQUEST_BODY_KEY in self.environ:
+            # wsgi.input was already consumed by a middleware through the old environ key
+            self._body = self.environ[REQUEST_BODY_KEY]
+            self._stream = StringIO(self._body)
+        elif length <= REQUEST_BODY['spool_threshold']:
+            self._body = self.environ[REQUEST_BODY_KEY] = read(length) if length else ''
+            # Read-only cStringIO shares the string instead of copying it
+            self._stream = StringIO(self._body)
+        else:
+            spool = tempfile.SpooledTemporaryFile(max_size=REQUEST_BODY['spool_threshold'])
+            remaining = length
+            while remaining > 0:
+                chunk = read(min(BODY_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                spool.write(chunk)
+                remaining -= len(chunk)
+            spool.seek(0)
+            self._stream = spool
+
+    @property
+    def stream(self):
+        """File-like request body, read from wsgi.input once"""
+        if self._stream is None:
+            self._read_body()
+        return self._stream
+
+    @property
+    def body(self):
+        if self._body is None:
+            stream = self.stream
+            if self._body is None:
+                self._body = self.environ[REQUEST_BODY_KEY] = stream.read()
+                stream.seek(0)
+        return self._body
+
+    @property
+    def content_process(self):
+        return get_content_process().get(self.content_type)
+
+    @property
+    def streaming(self):
+        """Body is decoded straight from wsgi.input, without buffering it first"""
+        return getattr(self.content_process, 'streaming', False)
+
+    @property
+    def form(self):
+        """Keyword arguments decoded from the body by the content processor"""
+        if self._form is None:
+            process, form = self.content_process, None
+            if process is not None and self.streaming:
+                if self._stream is None:
+                    self._stream = StringIO('')
+                    form = process(LimitedStream(self.environ['wsgi.input'], self._check_size()),
+                                   self.content_options)
+            elif process is not None:
+                form = process(self.body)
+            self._form = form if isinstance(form, dict) else {}
+        return self._form
+
+
+class LimitedStream(object):
+    """wsgi.input that never reads past CONTENT_LENGTH"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return ''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+class RequestArgs(collections.MutableMapping):
+    """
+    environ['REQUEST_KWARGS']的兼容视图, 首次访问时才解析查询参数, 读写都作用于Request.args
+
+    :param request: 请求视图
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def __getitem__(self, item):
+        return self.request.args[item]
+
+    def __setitem__(self, item, value):
+        self.request.args[item] = value
+
+    def __delitem__(self, item):
+        del self.request.args[item]
+
+    def __iter__(self):
+        return iter(self.request.args)
+
+    def __len__(self):
+        return len(self.request.args)
+
+    def __repr__(self):
+        return repr(self.request.args)
+
+
+def get_request(environ):
+    """
+    取得请求视图, 首次调用时创建并挂上旧的environ键:
+    REQUEST_KWARGS为查询参数的兼容视图, paster.kwargs在请求体读入内存后保存原始请求体
+
+    :param environ: WSGI环境
+    :return:
+    """
+    request = environ.get(REQUEST_ENVIRON_KEY)
+    if request is None:
+        request = environ[REQUEST_ENVIRON_KEY] = Request(environ)
+        if REQUEST_KWARGS_KEY not in environ:
+            environ[REQUEST_KWARGS_KEY] = RequestArgs(request)
+    return request
+
+
 def is_response_wrapper(obj):
     if hasattr(obj, 'headers') and hasattr(obj, 'content'):
         return True
@@ -30,6 +355,30 @@ def is_response_wrapper(obj):
         return False
 
 
+# Set by containers that can wait on awaitable handler results
+ASYNC_ENVIRON_KEY = 'paster.async'
+
+
+def is_awaitable(obj):
+    """Futures and coroutines returned by handlers, detected without importing an event loop"""
+    if hasattr(obj, '__await__'):
+        return True
+    return hasattr(obj, 'add_done_callback') and hasattr(obj, 'result')
+
+
+class DeferredResponse(object):
+    """
+    异步处理器的待定响应, 由异步容器等待awaitable完成后调用render生成WSGI响应体
+
+    :param awaitable: 处理器返回的Future或协程
+    :param render: render(value, error) -> WSGI响应体
+    """
+
+    def __init__(self, awaitable, render):
+        self.awaitable = awaitable
+        self.render = render
+
+
 def check_mime_type(filename):
     _filename = os.path.basename(filename)
     content_type = typegetter.mimeTypeGuesser(name=_filename)
@@ -84,3 +433,12 @@ class HttpDownload(BaseResponse):
 
 class HttpRender(BaseResponse):
     pass
+
+
+class HttpStream(BaseResponse):
+    """Send the content iterator chunk by chunk, non-string items as NDJSON lines"""
+
+    def __init__(self, content=None, headers=None, status_code=200, content_type=CONTENT_TYPE_NDJSON):
+        _headers = {'Content-Type': content_type}
+        _headers.update(headers if headers else {})
+        super(HttpStream, self).__init__(content, _headers, status_code=status_code)
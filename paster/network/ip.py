@@ -38,7 +38,7 @@ class IPv4(Packet):
     FORMAT = [
         ('version', 4),
         ('header_length', 4),
-        ('servcie_type', 8),
+        ('service_type', 8),
         ('total_length', 16),
         ('ident', 16),
         ('flag', 3),
@@ -55,7 +55,7 @@ class IPv4(Packet):
         val = self.__getitem__('version')
         if val != 4:
             raise PacketVerError('Expected version 4, but it is {0}.'.format(val))
-        self.status['version'] = 4
+        return val
 
     def _check_header_length(self):
         val = self.__getitem__('header_length')
@@ -84,7 +84,7 @@ class IPv4(Packet):
         self.status['relibility'] = 'Low' if (val & 4) >> 2 else 'Normal'
 
     def _parse_total_length(self):
-        val = self.__getitem__('service_type')
+        val = self.__getitem__('total_length')
         if val > 382:
             raise PacketWarnMsg('IP4 Packet length is too longger, val:{0}'.format(val))
         self.status['total_length'] = val
@@ -103,22 +103,22 @@ class IPv4(Packet):
         from ip_protocol import parse_protocol
         val = self.__getitem__('protocol')
         self.status['protocol'] = parse_protocol(val)
-        if self.status['protocol']:
+        if not self.status['protocol']:
             self.status['protocol'] = 'Unassigned'
 
-    def _parse_src_address(self):
+    def _parse_src_addr(self):
         val = self.__getitem__('src_addr')
-        self.status['src_addr'] = '.' .join(str((val >> 24) & 15),
-                                            str((val >> 16) & 15),
-                                            str((val >> 8) & 15),
-                                            str(val & 15))
+        self.status['src_addr'] = '.'.join([str((val >> 24) & 255),
+                                              str((val >> 16) & 255),
+                                              str((val >> 8) & 255),
+                                              str(val & 255)])
 
-    def _parse_dst_address(self):
+    def _parse_dst_addr(self):
         val = self.__getitem__('dst_addr')
-        self.status['dst_addr'] = '.' .join(str((val >> 24) & 15),
-                                            str((val >> 16) & 15),
-                                            str((val >> 8) & 15),
-                                            str(val & 15))
+        self.status['dst_addr'] = '.'.join([str((val >> 24) & 255),
+                                              str((val >> 16) & 255),
+                                              str((val >> 8) & 255),
+                                              str(val & 255)])
 
 
 class IPv6(Packet):
@@ -24,39 +24,78 @@ __author__ = 'terry'
 import sys
 import os.path
 import urllib
-import pickle
 import xml.etree.ElementTree as ET
 
 
 __all__ = ['parse_protocol']
 
 
-__target_file__ = os.path.join(os.path.dirname(__file__), 'ip_protocols.pc')
+__source_url__ = 'https://en.wikipedia.org/wiki/List_of_IP_protocol_numbers'
+__target_file__ = os.path.join(os.path.dirname(__file__), 'ip_protocol_table.py')
 
-
-def update():
-    f = urllib.urlopen('https://en.wikipedia.org/wiki/List_of_IP_protocol_numbers')
-    root = ET.fromstring(f.read())
-    try:
-        for i, j, k, p, r in root.findall('./body/div/div/div/table/'):
-            IP_PROTOCOLS[i.text] = p.text if not k.text else k.text
-    except ValueError:
-        pass
-    with open(__target_file__, 'w') as f:
-        pickle.dump(IP_PROTOCOLS, f)
+# Filled from the bundled ip_protocol_table on first lookup
+IP_PROTOCOLS = ()
 
 
-try:
-    IP_PROTOCOLS = pickle.load(open(__target_file__, 'r'))
-except:
-    IP_PROTOCOLS = dict()
-    update()
+def _load():
+    global IP_PROTOCOLS
+    if not IP_PROTOCOLS:
+        from ip_protocol_table import IP_PROTOCOLS as _table
+        IP_PROTOCOLS = _table
+    return IP_PROTOCOLS
 
 
 def parse_protocol(val):
-    return IP_PROTOCOLS.get(val, None)
+    """
+    协议号对应的协议关键字
+
+    :param val: 协议号, int或数字字符串
+    :return: 关键字, 未分配时为None
+    """
+    table = IP_PROTOCOLS or _load()
+    try:
+        val = int(val)
+    except (TypeError, ValueError):
+        return None
+    if 0 <= val < len(table):
+        return table[val]
+    return None
+
+
+def render_table(names):
+    with open(__file__.replace('.pyc', '.py')) as f:
+        header = ''.join(f.readlines()[:19])
+    lines = [header + '# Generated by `python -m paster.network.ip_protocol update`, do not edit.', '',
+             "__author__ = 'terry'", '', '',
+             '# Keyword of each assigned IP protocol number, indexed by number, None when unassigned',
+             'IP_PROTOCOLS = (']
+    for i, name in enumerate(names):
+        lines.append('    {0!r},  # {1}'.format(name, i))
+    lines.append(')')
+    return '\n'.join(lines) + '\n'
+
+
+def update(source=__source_url__):
+    """
+    离线构建步骤: 从IANA列表页面(URL或本地文件)重新生成ip_protocol_table.py
+
+    :param source: 页面地址或文件路径
+    :return:
+    """
+    f = open(source) if os.path.exists(source) else urllib.urlopen(source)
+    root = ET.fromstring(f.read())
+    names = [None] * 256
+    for row in root.iter('tr'):
+        cells = list(row)
+        if len(cells) < 4 or not (cells[0].text or '').strip().isdigit():
+            continue
+        number, keyword, protocol = int(cells[0].text), cells[2].text, cells[3].text
+        if number < len(names):
+            names[number] = (keyword or protocol or '').strip() or None
+    with open(__target_file__, 'w') as f:
+        f.write(render_table(names))
 
 
 if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == 'update':
-        update()
+        update(*sys.argv[2:3])
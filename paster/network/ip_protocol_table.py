@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Generated by `python -m paster.network.ip_protocol update`, do not edit.
+
+__author__ = 'terry'
+
+
+# Keyword of each assigned IP protocol number, indexed by number, None when unassigned
+IP_PROTOCOLS = (
+    'HOPOPT',  # 0
+    'ICMP',  # 1
+    'IGMP',  # 2
+    'GGP',  # 3
+    'IP-in-IP',  # 4
+    'ST',  # 5
+    'TCP',  # 6
+    'CBT',  # 7
+    'EGP',  # 8
+    'IGP',  # 9
+    'BBN-RCC-MON',  # 10
+    'NVP-II',  # 11
+    'PUP',  # 12
+    'ARGUS',  # 13
+    'EMCON',  # 14
+    'XNET',  # 15
+    'CHAOS',  # 16
+    'UDP',  # 17
+    'MUX',  # 18
+    'DCN-MEAS',  # 19
+    'HMP',  # 20
+    'PRM',  # 21
+    'XNS-IDP',  # 22
+    'TRUNK-1',  # 23
+    'TRUNK-2',  # 24
+    'LEAF-1',  # 25
+    'LEAF-2',  # 26
+    'RDP',  # 27
+    'IRTP',  # 28
+    'ISO-TP4',  # 29
+    'NETBLT',  # 30
+    'MFE-NSP',  # 31
+    'MERIT-INP',  # 32
+    'DCCP',  # 33
+    '3PC',  # 34
+    'IDPR',  # 35
+    'XTP',  # 36
+    'DDP',  # 37
+    'IDPR-CMTP',  # 38
+    'TP++',  # 39
+    'IL',  # 40
+    'IPv6',  # 41
+    'SDRP',  # 42
+    'IPv6-Route',  # 43
+    'IPv6-Frag',  # 44
+    'IDRP',  # 45
+    'RSVP',  # 46
+    'GRE',  # 47
+    'MHRP',  # 48
+    'BNA',  # 49
+    'ESP',  # 50
+    'AH',  # 51
+    'I-NLSP',  # 52
+    'SWIPE',  # 53
+    'NARP',  # 54
+    'MOBILE',  # 55
+    'TLSP',  # 56
+    'SKIP',  # 57
+    'IPv6-ICMP',  # 58
+    'IPv6-NoNxt',  # 59
+    'IPv6-Opts',  # 60
+    'Any host internal protocol',  # 61
+    'CFTP',  # 62
+    'Any local network',  # 63
+    'SAT-EXPAK',  # 64
+    'KRYPTOLAN',  # 65
+    'RVD',  # 66
+    'IPPC',  # 67
+    'Any distributed file system',  # 68
+    'SAT-MON',  # 69
+    'VISA',  # 70
+    'IPCU',  # 71
+    'CPNX',  # 72
+    'CPHB',  # 73
+    'WSN',  # 74
+    'PVP',  # 75
+    'BR-SAT-MON',  # 76
+    'SUN-ND',  # 77
+    'WB-MON',  # 78
+    'WB-EXPAK',  # 79
+    'ISO-IP',  # 80
+    'VMTP',  # 81
+    'SECURE-VMTP',  # 82
+    'VINES',  # 83
+    'IPTM',  # 84
+    'NSFNET-IGP',  # 85
+    'DGP',  # 86
+    'TCF',  # 87
+    'EIGRP',  # 88
+    'OSPF',  # 89
+    'Sprite-RPC',  # 90
+    'LARP',  # 91
+    'MTP',  # 92
+    'AX.25',  # 93
+    'IPIP',  # 94
+    'MICP',  # 95
+    'SCC-SP',  # 96
+    'ETHERIP',  # 97
+    'ENCAP',  # 98
+    'Any private encryption scheme',  # 99
+    'GMTP',  # 100
+    'IFMP',  # 101
+    'PNNI',  # 102
+    'PIM',  # 103
+    'ARIS',  # 104
+    'SCPS',  # 105
+    'QNX',  # 106
+    'A/N',  # 107
+    'IPComp',  # 108
+    'SNP',  # 109
+    'Compaq-Peer',  # 110
+    'IPX-in-IP',  # 111
+    'VRRP',  # 112
+    'PGM',  # 113
+    'Any 0-hop protocol',  # 114
+    'L2TP',  # 115
+    'DDX',  # 116
+    'IATP',  # 117
+    'STP',  # 118
+    'SRP',  # 119
+    'UTI',  # 120
+    'SMP',  # 121
+    'SM',  # 122
+    'PTP',  # 123
+    'IS-IS over IPv4',  # 124
+    'FIRE',  # 125
+    'CRTP',  # 126
+    'CRUDP',  # 127
+    'SSCOPMCE',  # 128
+    'IPLT',  # 129
+    'SPS',  # 130
+    'PIPE',  # 131
+    'SCTP',  # 132
+    'FC',  # 133
+    'RSVP-E2E-IGNORE',  # 134
+    'Mobility Header',  # 135
+    'UDPLite',  # 136
+    'MPLS-in-IP',  # 137
+    'manet',  # 138
+    'HIP',  # 139
+    'Shim6',  # 140
+    'WESP',  # 141
+    'ROHC',  # 142
+    None,  # 143
+    None,  # 144
+    None,  # 145
+    None,  # 146
+    None,  # 147
+    None,  # 148
+    None,  # 149
+    None,  # 150
+    None,  # 151
+    None,  # 152
+    None,  # 153
+    None,  # 154
+    None,  # 155
+    None,  # 156
+    None,  # 157
+    None,  # 158
+    None,  # 159
+    None,  # 160
+    None,  # 161
+    None,  # 162
+    None,  # 163
+    None,  # 164
+    None,  # 165
+    None,  # 166
+    None,  # 167
+    None,  # 168
+    None,  # 169
+    None,  # 170
+    None,  # 171
+    None,  # 172
+    None,  # 173
+    None,  # 174
+    None,  # 175
+    None,  # 176
+    None,  # 177
+    None,  # 178
+    None,  # 179
+    None,  # 180
+    None,  # 181
+    None,  # 182
+    None,  # 183
+    None,  # 184
+    None,  # 185
+    None,  # 186
+    None,  # 187
+    None,  # 188
+    None,  # 189
+    None,  # 190
+    None,  # 191
+    None,  # 192
+    None,  # 193
+    None,  # 194
+    None,  # 195
+    None,  # 196
+    None,  # 197
+    None,  # 198
+    None,  # 199
+    None,  # 200
+    None,  # 201
+    None,  # 202
+    None,  # 203
+    None,  # 204
+    None,  # 205
+    None,  # 206
+    None,  # 207
+    None,  # 208
+    None,  # 209
+    None,  # 210
+    None,  # 211
+    None,  # 212
+    None,  # 213
+    None,  # 214
+    None,  # 215
+    None,  # 216
+    None,  # 217
+    None,  # 218
+    None,  # 219
+    None,  # 220
+    None,  # 221
+    None,  # 222
+    None,  # 223
+    None,  # 224
+    None,  # 225
+    None,  # 226
+    None,  # 227
+    None,  # 228
+    None,  # 229
+    None,  # 230
+    None,  # 231
+    None,  # 232
+    None,  # 233
+    None,  # 234
+    None,  # 235
+    None,  # 236
+    None,  # 237
+    None,  # 238
+    None,  # 239
+    None,  # 240
+    None,  # 241
+    None,  # 242
+    None,  # 243
+    None,  # 244
+    None,  # 245
+    None,  # 246
+    None,  # 247
+    None,  # 248
+    None,  # 249
+    None,  # 250
+    None,  # 251
+    None,  # 252
+    None,  # 253
+    None,  # 254
+    None,  # 255
+)
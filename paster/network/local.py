@@ -32,7 +32,7 @@ class TCP(Packet):
         ('offset', 4),
         ('reserved', 4),
         ('flags', 8),
-        ('window', 8),
+        ('window', 16),
         ('checksum', 16),
         ('urgent_pointer', 16),
     ]
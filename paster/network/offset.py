@@ -21,169 +21,115 @@
 __author__ = 'terry'
 
 
-from cffi_utils import CFFIObject, cffi
-
-
-class Offset(CFFIObject):
-    STRUCTURE_CONTEXT = '''
-    struct offset_t {
-        unsigned long value;
-        unsigned int offset_len;
-        char name[32];
-    };
-    '''
-
-    API_CONTEXT = '''
-    unsigned char* offset_chat(struct offset_t*, int);
-    struct offset_t* offset_split(unsigned char*, int);
-    '''
-
-    CONTEXT = '''
-    #include <malloc.h>
-    #include <string.h>
-
-    static unsigned int dword_chat(unsigned long* a, unsigned int* offset, int len) {
-        int i;
-        unsigned int r;
-
-        r = 0;
-        for(i=0;i<len;i++) {
-            r |= (a[i] & (0xffffffff >> (32 - offset[i]))) << (32 - offset[i]);
-        }
-        return r;
-    }
-
-    static unsigned short word_chat(unsigned long* a, unsigned int* offset, int len) {
-        int i;
-        unsigned short r;
-
-        r = 0;
-        for(i=0;i<len;i++) {
-            r |= (a[i] & (0xffffffff >> (32 - offset[i]))) << (16 - offset[i]);
-        }
-        return r;
-    }
-
-    static unsigned char byte_chat(unsigned long* a, unsigned int* offset, int len) {
-        int i;
-        unsigned char r;
-
-        r = 0;
-        for(i=0;i<len;i++) {
-            r |= (a[i] & (0xffffffff >> (32 - offset[i]))) << (8 - offset[i]);
-        }
-        return r;
-    }
-
-    // Support offset block size is 32.
-    unsigned char* (*offset_func[5])(unsigned long*, unsigned int*, int) = {
-        NULL,
-        byte_chat,
-        word_chat,
-        NULL,
-        dword_chat,
-    };
-
-    static int offset_is_enough(unsigned long v) {
-        if (v == 0 || (v % 8) != 0) {
-            return 0;
-        }
-
-        int len;
-        len = v / 8;
-        if (len == 1 || len == 2 || len == 4) {
-            return len;
-        }
-        return 0;
-    }
-
-
-    static unsigned char* offset_chat(struct offset_t* a, int len) {
-        int i, j, buf_len, buf_offset_len, ret_len;
-        struct offset_t* u = NULL;
-        unsigned char* ret = NULL;
-        unsigned char* ret_buf = NULL;
-        unsigned long buf[len];
-        unsigned int buf_offset[len];
-
-        u = a;
-        ret_len = buf_len = buf_offset_len = 0;
-        for(i=0;i<len;i++) {
-            buf[buf_len] = u[i].value;
-            buf_offset[buf_len] = u[i].offset_len;
-            buf_offset_len += buf_offset[buf_len];
-            buf_len += 1;
-
-            if ((j = offset_is_enough((int)buf_offset_len))) {
-                ret_len += j;
-                // choose offset processing function?
-                ret_buf = (*offset_func[j])((unsigned long*)&buf, (unsigned int*)&buf_offset, buf_len);
-                // malloc/realloc result buffer first and ready to memcpy the buffer after result buffer!
-                if (ret != NULL) {
-                    ret = (unsigned char*)realloc(ret, ret_len);
-                    memcpy(ret + (ret_len - j), &ret_buf, j * sizeof(unsigned char));
-                } else {
-                    ret = (unsigned char*)calloc(ret_len, sizeof(unsigned char));
-                    memset(ret, 0, ret_len * sizeof(unsigned char));
-                    memcpy(ret, &ret_buf, j * sizeof(unsigned char));
-                }
-                memset(&buf, 0, len * sizeof(unsigned long));
-                memset(&buf_offset, 0, len * sizeof(unsigned int));
-                buf_len = buf_offset_len = 0;
-            }
-        }
-
-        return ret;
-    }
-
-    //static struct offset_t* offset_split(unsigned char* a, int len) {
-    //    struct offset_t* ret;
-    //    return ret;
-    //}
-'''
-
-
 NAME = 0
 LEN = 1
 VALUE = 2
 
+# The compiled _offset extension, imported once per process
+_OFFSET = {}
+
+
+def _load():
+    try:
+        return _OFFSET['ffi'], _OFFSET['lib']
+    except KeyError:
+        pass
+    try:
+        from _offset import ffi, lib
+    except ImportError:
+        # Not built at deploy time, compile it next to this module once, see offset_build.build
+        from offset_build import build
+        build()
+        from _offset import ffi, lib
+    _OFFSET.update(ffi=ffi, lib=lib)
+    return ffi, lib
+
+
+class Offset(object):
+    """Shared handle on the compiled packer, api is the extension's lib"""
+
+    @property
+    def api(self):
+        return _load()[1]
+
+    @property
+    def ffi(self):
+        return _load()[0]
+
 
 def format_data(data):
+    """
+    字段值转换为整数
+
+    :param data: 整数, 数字字符串(十进制或0x十六进制), 或大端字节串
+    :return:
+    """
     if not data:
-        return chr(0)
-    if isinstance(data, str):
+        return 0
+    if isinstance(data, (int, long)):
+        return data
+    if isinstance(data, (str, bytearray)):
+        data = str(data)
         try:
-            value = chr(int(data))
-        except:
+            return int(data)
+        except ValueError:
             try:
-                value = chr(int(data, '16'))
-            except:
-                value = ''.join([chr(i) for i in data])
-    else:
-        value = chr(data)
-    return value
+                return int(data, 16)
+            except ValueError:
+                return int(data.encode('hex'), 16)
+    return int(data)
+
+
+def _new_offset_struct(ffi, lists):
+    fields = [item for lst in lists for item in lst]
+    inst = ffi.new('struct offset_t []', len(fields) or 1)
+    for i, item in enumerate(fields):
+        inst[i].value = format_data(item[VALUE])
+        inst[i].offset_len = item[LEN]
+    return inst
 
 
 def new_offset_struct(lst):
-    i = 0
-    inst = CFFIObject.ffi.new("struct offset_t [{0}]".format(len(lst)))
-    for item in lst:
-        name, length, value = item[NAME], item[LEN], format_data(item[VALUE])
-        if not value:
-            value = 0
-        inst[i].value = CFFIObject.ffi.cast("unsigned long", value)
-        inst[i].offset_len = CFFIObject.ffi.cast("unsigned int", length)
-        inst[i].name = name
-        i += 1
+    return _new_offset_struct(_load()[0], [lst])
 
-    return inst
 
-
-def offset_chat(lst):
-    s = new_offset_struct(lst)
-    p = Offset()
-    return p.api.offset_chat(s, len(lst))
+def _byte_len(lst):
+    return (sum([item[LEN] for item in lst]) + 7) // 8
 
 
-# def offset_split(bytes):
-#     pass
+def offset_chat(lst):
+    """
+    按位长度依次拼接字段, 高位在前
+
+    :param lst: [(名称, 位长度, 值)]
+    :return: 打包后的字节串
+    """
+    ffi, lib = _load()
+    size = _byte_len(lst)
+    out = ffi.new('unsigned char []', size or 1)
+    n = lib.offset_pack(_new_offset_struct(ffi, [lst]), len(lst), out, size)
+    if n < 0:
+        raise ValueError('Offset field is wider than 64 bits')
+    return ffi.buffer(out, n)[:]
+
+
+def offset_chat_many(lists):
+    """
+    一次原生调用打包多组字段
+
+    :param lists: [[(名称, 位长度, 值)]]
+    :return: 每组的字节串
+    """
+    ffi, lib = _load()
+    sizes = [_byte_len(lst) for lst in lists]
+    total = sum(sizes)
+    out = ffi.new('unsigned char []', total or 1)
+    counts = ffi.new('int []', [len(lst) for lst in lists] or [0])
+    n = lib.offset_pack_many(_new_offset_struct(ffi, lists), counts, len(lists), out, total)
+    if n < 0:
+        raise ValueError('Offset field is wider than 64 bits')
+    data, packed, start = ffi.buffer(out, n)[:], [], 0
+    for size in sizes:
+        packed.append(data[start:start + size])
+        start += size
+    return packed
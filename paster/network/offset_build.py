@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+__author__ = 'terry'
+
+
+import os
+import os.path
+import shutil
+import tempfile
+
+import cffi
+
+
+CDEF = '''
+struct offset_t {
+    unsigned long long value;
+    unsigned int offset_len;
+};
+
+int offset_pack(const struct offset_t*, int, unsigned char*, int);
+int offset_pack_many(const struct offset_t*, const int*, int, unsigned char*, int);
+'''
+
+SOURCE = '''
+#include <string.h>
+
+struct offset_t {
+    unsigned long long value;
+    unsigned int offset_len;
+};
+
+/*
+ * Pack n fields MSB first into out, the last byte is zero padded.
+ * Returns the number of bytes written, -1 when a field is wider than
+ * 64 bits or out is too small.
+ */
+int offset_pack(const struct offset_t* fields, int n, unsigned char* out, int out_len) {
+    unsigned long long total = 0, pos = 0, v;
+    unsigned int bits, space, take, chunk;
+    int i, nbytes;
+
+    for (i = 0; i < n; i++) {
+        if (fields[i].offset_len > 64) {
+            return -1;
+        }
+        total += fields[i].offset_len;
+    }
+    nbytes = (int)((total + 7) / 8);
+    if (nbytes > out_len) {
+        return -1;
+    }
+    memset(out, 0, nbytes);
+
+    for (i = 0; i < n; i++) {
+        bits = fields[i].offset_len;
+        v = fields[i].value;
+        if (bits < 64) {
+            v &= (1ULL << bits) - 1;
+        }
+        while (bits > 0) {
+            space = 8 - (unsigned int)(pos & 7);
+            take = bits < space ? bits : space;
+            chunk = (unsigned int)((v >> (bits - take)) & ((1u << take) - 1));
+            out[pos >> 3] |= (unsigned char)(chunk << (space - take));
+            bits -= take;
+            pos += take;
+        }
+    }
+    return nbytes;
+}
+
+/* Pack groups of counts[g] fields back to back, each group starting on a byte boundary. */
+int offset_pack_many(const struct offset_t* fields, const int* counts, int groups, unsigned char* out, int out_len) {
+    int g, n, written = 0;
+
+    for (g = 0; g < groups; g++) {
+        n = offset_pack(fields, counts[g], out + written, out_len - written);
+        if (n < 0) {
+            return -1;
+        }
+        written += n;
+        fields += counts[g];
+    }
+    return written;
+}
+'''
+
+ffibuilder = cffi.FFI()
+ffibuilder.cdef(CDEF)
+ffibuilder.set_source('_offset', SOURCE)
+
+
+def build(target_dir=os.path.dirname(os.path.abspath(__file__))):
+    """
+    编译_offset扩展到target_dir, 部署时执行一次
+
+    在本进程的临时目录中编译后原子地改名到target_dir, 多个进程同时编译也不会读到不完整的文件
+
+    :param target_dir: 输出目录
+    :return: 扩展文件路径
+    """
+    build_dir = tempfile.mkdtemp(prefix='.offset-build-', dir=target_dir)
+    try:
+        built = ffibuilder.compile(tmpdir=build_dir)
+        target = os.path.join(target_dir, os.path.basename(built))
+        os.rename(built, target)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return target
+
+
+if __name__ == '__main__':
+    print(build())
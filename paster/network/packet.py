@@ -89,62 +89,243 @@ class PacketWarnMsg(PacketWarn):
     pass
 
 
+WORD_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+class Layout(object):
+    """
+    FORMAT预编译结果, 每个Packet子类一份
+
+    :param fmt: [(名称, 位长度)]
+    """
+
+    def __init__(self, fmt):
+        self.names = tuple([k for k, l in fmt])
+        self.lengths = tuple([l for k, l in fmt])
+        self.index = dict([(k, i) for i, k in enumerate(self.names)])
+        self.masks = tuple([(1 << l) - 1 for l in self.lengths])
+        offsets, bit = [], 0
+        for l in self.lengths:
+            offsets.append(bit)
+            bit += l
+        self.offsets = tuple(offsets)
+        self.bits = bit
+        self.size = (bit + 7) // 8
+        self.byte_offsets = tuple([o // 8 for o in offsets])
+        # 字段末尾到所在字节边界的右移位数
+        self.shifts = tuple([-(o + l) % 8 for o, l in zip(offsets, self.lengths)])
+        self._compile_words()
+        self.groups = {}
+        for key in set([k.rstrip('0123456789') for k in self.names]):
+            if key not in self.index:
+                self.lookup(key)
+
+    def _compile_words(self):
+        """
+        相邻字段按字节边界合并成字, 1/2/4/8字节用B/H/I/Q, 其余宽度用s
+        """
+        codes, words, fields = ['!'], [], []
+        start = 0
+        for i, (o, l) in enumerate(zip(self.offsets, self.lengths)):
+            end = o + l
+            if end % 8 and i + 1 < len(self.lengths):
+                continue
+            width = (end - start + 7) // 8
+            code = WORD_CODES.get(width)
+            for j in range(len(fields), i + 1):
+                fields.append((len(words), width * 8 - (self.offsets[j] - start) - self.lengths[j]))
+            codes.append(code or '{0}s'.format(width))
+            words.append(width if code is None else 0)
+            start = end
+        self.codec = struct.Struct(''.join(codes))
+        # 字段所在字的下标与右移位数, 字为s时记录其字节宽度
+        self.fields = tuple(fields)
+        self.words = tuple(words)
+
+    def unpack_from(self, data, offset=0):
+        """
+        从data读取全部字段值
+
+        :param data: 支持buffer协议的对象, 如memoryview
+        :param offset: 起始字节偏移
+        :return: 字段值列表
+        """
+        words = self.codec.unpack_from(data, offset)
+        if any(self.words):
+            words = [int(w.encode('hex'), 16) if n else w for w, n in zip(words, self.words)]
+        return [(words[w] >> shift) & mask for (w, shift), mask in zip(self.fields, self.masks)]
+
+    def _pack_words(self, values):
+        words = [0] * len(self.words)
+        for (w, shift), mask, v in zip(self.fields, self.masks, values):
+            if v:
+                words[w] |= (v & mask) << shift
+        for w, n in enumerate(self.words):
+            if n:
+                words[w] = '{0:0{1}x}'.format(words[w], n * 2).decode('hex')
+        return words
+
+    def pack(self, values):
+        return self.codec.pack(*self._pack_words(values))
+
+    def pack_into(self, buf, offset, values):
+        self.codec.pack_into(buf, offset, *self._pack_words(values))
+
+    def lookup(self, key):
+        """
+        名称前缀对应的连续字段下标, 结果缓存
+
+        :param key: 字段名或前缀, 如IPv6的src_addr
+        :return: 下标元组
+        """
+        try:
+            return self.groups[key]
+        except KeyError:
+            pass
+        found = []
+        for i, k in enumerate(self.names):
+            if k.startswith(key):
+                found.append(i)
+            elif found:
+                break
+        self.groups[key] = found = tuple(found)
+        return found
+
+
+class PacketMeta(type):
+    """Compile FORMAT into cls.LAYOUT once, instances keep values in __slots__"""
+
+    def __new__(mcs, name, bases, attrs):
+        attrs.setdefault('__slots__', ())
+        cls = super(PacketMeta, mcs).__new__(mcs, name, bases, attrs)
+        cls.LAYOUT = Layout(cls.FORMAT or ())
+        return cls
+
+
 class Packet(object):
+    __metaclass__ = PacketMeta
+    __slots__ = ('values', 'status', 'len')
+
     FORMAT = None
 
     def __init__(self):
-        self.struct = [[k, l, None] for k, l in self.FORMAT]
+        self.values = [None] * len(self.LAYOUT.names)
         self.status = {}
         self.len = None
 
+    @property
+    def struct(self):
+        return [[k, l, v] for k, l, v in zip(self.LAYOUT.names, self.LAYOUT.lengths, self.values)]
+
     def __getitem__(self, key):
-        k_b = []
-        for k, l, v in self.struct:
-            if k.startswith(key):
-                k_b.append(v)
-            elif len(k_b) > 0:
-                break
-        return ''.join(k_b) or None
+        layout = self.LAYOUT
+        i = layout.index.get(key)
+        if i is not None:
+            return self.values[i]
+        indexes = layout.lookup(key)
+        vals = [self.values[i] for i in indexes]
+        if not indexes or vals.count(None) == len(vals):
+            return None
+        # 多个字段按顺序拼成一个整数
+        r = 0
+        for i, v in zip(indexes, vals):
+            r = (r << layout.lengths[i]) | (v or 0)
+        return r
 
     def __setitem__(self, key, value):
-        i = 0
-        for k, l, v in self.struct:
-            if k == key:
-                self.struct[i][2] = value
-                return True
-            i += 1
-        return False
+        layout = self.LAYOUT
+        i = layout.index.get(key)
+        if i is not None:
+            self.values[i] = value
+            return True
+        indexes = layout.lookup(key)
+        if not indexes:
+            return False
+        for i in reversed(indexes):
+            self.values[i] = value & layout.masks[i]
+            value >>= layout.lengths[i]
+        return True
 
     def iterate_packet_itemkey(self):
-        return [k for k, l, v in self.struct]
+        return list(self.LAYOUT.names)
 
     def iterate_packet_itemval(self):
-        return [v for k, l, v in self.struct]
+        return list(self.values)
 
     def is_expected(self, name):
+        """
+        执行字段的_check_/_parse_校验, 没有校验时直接记录字段值
+
+        :param name: 字段名
+        :return:
+        """
         try:
-            with self.__getitem__(name) as it:
-                _func = getattr(self, '_parse_{0}')
+            for prefix in ('_check_', '_parse_'):
+                _func = getattr(self, prefix + name, None)
                 if callable(_func):
                     return _func()
-                else:
-                    self.status[name] = it
+            self.status[name] = self.__getitem__(name)
         except PacketError as e:
             LOG.error(e)
             raise e
         except PacketWarn as e:
             LOG.warn(e)
 
-    def pack(self, header, data):
-        raise NotImplementedError()
+    def pack(self, header=None, data=None):
+        """
+        编码头部字段
+
+        :param header: 前置的外层头部, Packet或字节串
+        :param data: 后续负载
+        :return: 字节串
+        """
+        packed = self.LAYOUT.pack(self.values)
+        if header is not None or data is not None:
+            if isinstance(header, Packet):
+                header = header.pack()
+            packed = ''.join([header or '', packed, data or ''])
+        return packed
+
+    def pack_into(self, buf, offset=0):
+        """
+        编码到预分配的缓冲区
+
+        :param buf: 可写缓冲区, 如bytearray
+        :param offset: 起始字节偏移
+        :return: 写入后的偏移
+        """
+        self.LAYOUT.pack_into(buf, offset, self.values)
+        return offset + self.LAYOUT.size
 
     @classmethod
-    def force_unpack(cls, data):
-        raise NotImplementedError()
+    def force_unpack(cls, data, offset=0):
+        """
+        不做校验直接解码
+
+        :param data: 字节串, bytearray或memoryview, 不复制
+        :param offset: 头部起始字节偏移
+        :return: 实例, len为头部字节数
+        """
+        if not isinstance(data, memoryview):
+            data = memoryview(data)
+        try:
+            values = cls.LAYOUT.unpack_from(data, offset)
+        except struct.error as e:
+            raise PacketErrorMsg('{0} header is too short: {1}'.format(cls.__name__, e))
+        packet = cls()
+        packet.values = values
+        packet.len = cls.LAYOUT.size
+        return packet
 
     @classmethod
-    def safe_unpack(cls, data):
-        raise NotImplementedError()
+    def safe_unpack(cls, data, offset=0):
+        """
+        解码并依次执行各字段校验, 错误抛出PacketError, 警告只记录日志
+        """
+        packet = cls.force_unpack(data, offset)
+        for name in cls.LAYOUT.names:
+            packet.is_expected(name)
+        return packet
 
 
 def push_status(name, help_text, location='status'):
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import sys
+import json
+import time
+import errno
+import fcntl
+import signal
+import socket
+
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.concurrent import is_future
+from tornado.netutil import bind_sockets, set_close_exec
+
+from utils import worker_count
+from container import make_container
+from log import get_logger
+
+__author__ = 'terry'
+
+
+logger = get_logger(__name__)
+
+
+# A worker that dies sooner than this after being forked is restarted after the same delay
+RESTART_DELAY = 1.0
+
+# Seconds a worker keeps serving in-flight requests after SIGTERM, graceful_timeout per [service:]
+GRACEFUL_TIMEOUT = 30.0
+DRAIN_INTERVAL = 0.1
+
+# Listening sockets and the retiring supervisor, handed to the re-executed supervisor on reload
+LISTEN_FDS_ENV = 'PASTER_LISTEN_FDS'
+RELOAD_PARENT_ENV = 'PASTER_RELOAD_PARENT'
+
+
+def is_prefork(services):
+    return any([worker_count(_conf.get('workers')) for _app, _conf in services.values()])
+
+
+def serve(app, conf, sockets):
+    """
+    在当前进程的新IOLoop上服务已绑定的监听端口, 收到SIGTERM后停止接受连接, 处理完进行中的请求或超时后退出
+
+    :param app: URLMap
+    :param conf: 服务配置
+    :param sockets: 监听socket
+    :return:
+    """
+    # The loop of the parent must not be shared with a forked child
+    IOLoop.clear_instance()
+    loop = IOLoop.instance()
+    # Per-process resources such as connection pools are created after fork
+    app.init()
+    container = make_container(app, conf)
+    requests = {'active': 0, 'started': 0}
+
+    def finished(future=None):
+        requests['active'] -= 1
+
+    def handle(request):
+        requests['started'] += 1
+        requests['active'] += 1
+        result = container(request)
+        if is_future(result):
+            result.add_done_callback(finished)
+        else:
+            finished()
+
+    server = HTTPServer(handle)
+    server.add_sockets(sockets)
+    timeout = float(conf.get('graceful_timeout', GRACEFUL_TIMEOUT))
+
+    def drain():
+        server.stop()
+        deadline = time.time() + timeout
+
+        def check(started):
+            # Connections accepted just before stop get one more tick to send their request
+            if (not requests['active'] and requests['started'] == started) or time.time() >= deadline:
+                loop.stop()
+            else:
+                loop.call_later(DRAIN_INTERVAL, check, requests['started'])
+        loop.call_later(DRAIN_INTERVAL, check, requests['started'])
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: loop.add_callback_from_signal(drain))
+    loop.start()
+
+
+def read_pidfile(pidfile):
+    try:
+        with open(pidfile) as f:
+            return int(f.read().strip())
+    except (IOError, ValueError):
+        return None
+
+
+def _inherited_sockets():
+    """Sockets handed over by the supervisor being replaced, keyed by address:port"""
+    fds = os.environ.pop(LISTEN_FDS_ENV, None)
+    inherited = {}
+    for key, items in (json.loads(fds) if fds else {}).items():
+        inherited[key] = []
+        for fd, family in items:
+            sock = socket.fromfd(fd, family, socket.SOCK_STREAM)
+            os.close(fd)
+            set_close_exec(sock.fileno())
+            sock.setblocking(0)
+            inherited[key].append(sock)
+    return inherited
+
+
+class Supervisor(object):
+    """
+    预派生进程管理: 父进程在loadapp后绑定各服务端口, 按workers派生子进程共享监听socket, 子进程退出后重启.
+    收到SIGHUP时以新配置和代码重新执行自身并移交监听socket, 新进程就绪后旧子进程平滑退出
+
+    :param services: loadapp返回的{服务名: (应用, 配置)}
+    :param pidfile: 写入主进程pid的文件
+    """
+
+    def __init__(self, services, pidfile=None):
+        self.services = services
+        self.pidfile = pidfile
+        self.sockets = {}
+        self.slots = []
+        self.children = {}
+        self.started = {}
+        self.stopping = False
+        self.successor = None
+
+    @staticmethod
+    def _listen_key(conf):
+        return '{0}:{1}'.format(conf['address'], conf['port'])
+
+    def bind(self):
+        inherited = _inherited_sockets()
+        for name, (_app, _conf) in self.services.items():
+            key = self._listen_key(_conf)
+            if key in inherited:
+                self.sockets[name] = inherited.pop(key)
+            else:
+                self.sockets[name] = bind_sockets(int(_conf['port']), address=_conf['address'])
+            self.slots.extend([name] * (worker_count(_conf.get('workers')) or 1))
+        # Services removed from the new configuration stop listening
+        for socks in inherited.values():
+            for sock in socks:
+                sock.close()
+
+    def spawn(self, slot):
+        name = self.slots[slot]
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGINT, signal.SIGHUP, signal.SIGUSR2):
+                signal.signal(signum, signal.SIG_DFL)
+            code = 0
+            try:
+                _app, _conf = self.services[name]
+                serve(_app, _conf, self.sockets[name])
+            except Exception:
+                logger.exception('Worker of {0} failed'.format(name))
+                code = 1
+            finally:
+                os._exit(code)
+        logger.info('Started worker {0} of {1}'.format(pid, name))
+        self.children[pid] = slot
+        self.started[slot] = time.time()
+        return pid
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def reload(self, signum=None, frame=None):
+        """Re-execute the command line, the successor signals SIGUSR2 once its workers are forked"""
+        if self.stopping or self.successor:
+            return
+        fds = {}
+        for name, socks in self.sockets.items():
+            fds[self._listen_key(self.services[name][1])] = [(sock.fileno(), sock.family) for sock in socks]
+        pid = os.fork()
+        if pid == 0:
+            try:
+                for items in fds.values():
+                    for fd, family in items:
+                        flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+                        fcntl.fcntl(fd, fcntl.F_SETFD, flags & ~fcntl.FD_CLOEXEC)
+                env = dict(os.environ)
+                env[LISTEN_FDS_ENV] = json.dumps(fds)
+                env[RELOAD_PARENT_ENV] = str(os.getppid())
+                os.execve(sys.executable, [sys.executable] + sys.argv, env)
+            finally:
+                os._exit(1)
+        logger.info('Reloading, new supervisor {0}'.format(pid))
+        self.successor = pid
+
+    def retire(self, signum=None, frame=None):
+        if not self.successor:
+            return
+        logger.info('Supervisor {0} ready, draining workers'.format(self.successor))
+        self.stop()
+
+    def _ready(self):
+        if self.pidfile:
+            with open(self.pidfile, 'w') as f:
+                f.write(str(os.getpid()))
+        parent = os.environ.pop(RELOAD_PARENT_ENV, None)
+        if parent:
+            try:
+                os.kill(int(parent), signal.SIGUSR2)
+            except OSError:
+                pass
+
+    def run(self):
+        if not self.sockets:
+            self.bind()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.reload)
+        signal.signal(signal.SIGUSR2, self.retire)
+        for slot in range(len(self.slots)):
+            self.spawn(slot)
+        self._ready()
+        try:
+            self._supervise()
+        finally:
+            if self.pidfile and read_pidfile(self.pidfile) == os.getpid():
+                os.remove(self.pidfile)
+
+    def _supervise(self):
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    break
+                raise
+            if pid == self.successor:
+                # Keep serving with the current workers when the new configuration fails to start
+                logger.error('Reload failed, supervisor {0} exited with status {1}'.format(pid, status))
+                self.successor = None
+                continue
+            slot = self.children.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            logger.warning('Worker {0} of {1} exited with status {2}, restarting'.format(pid, self.slots[slot], status))
+            if time.time() - self.started[slot] < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            if not self.stopping:
+                self.spawn(slot)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import sys
+import json
+import resource
+from contextlib import contextmanager
+
+__author__ = 'terry'
+
+
+# PASTER_PROFILE_STARTUP=1 prints the report to stderr, PASTER_PROFILE_STARTUP=path.json writes it as JSON
+PROFILE_ENV = 'PASTER_PROFILE_STARTUP'
+
+PAGE_SIZE = resource.getpagesize()
+
+# Slowest spans listed after the nested report
+REPORT_TOP = 10
+
+
+def _rss():
+    """Resident memory in bytes, peak RSS where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (IOError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, KB elsewhere
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class StartupProfiler(object):
+    """
+    启动耗时记录: 按开始顺序记录各配置段、工厂调用、模型导入的耗时和内存变化
+
+    wall为包含子项的耗时, self为扣除子项后的耗时
+    """
+
+    def __init__(self):
+        # timing imports content, which needs utils, so it is loaded once profiling starts
+        from timing import clock
+        self.clock = clock
+        self.records = []
+        self.stack = []
+
+    def enter(self, kind, name):
+        # Appended on entry so records stay in start order, with parents before their children
+        record = dict(kind=kind, name=name, depth=len(self.stack), wall=0.0, self=0.0, memory=0)
+        self.records.append(record)
+        self.stack.append([record, self.clock(), _rss(), 0.0])
+
+    def exit(self):
+        record, start, rss, children = self.stack.pop()
+        wall = self.clock() - start
+        if self.stack:
+            self.stack[-1][3] += wall
+        record.update(wall=wall, self=wall - children, memory=_rss() - rss)
+        return not self.stack
+
+    def top(self, count=REPORT_TOP):
+        return sorted(self.records, key=lambda r: r['wall'], reverse=True)[:count]
+
+    def report(self, target):
+        if target.lower().endswith('.json'):
+            with open(target, 'w') as f:
+                json.dump(dict(pid=os.getpid(), records=self.records, top=self.top()), f, indent=2)
+            return
+        out = sys.stderr
+        self._write(out, self.records, indent=True)
+        out.write('\nslowest {0}:\n'.format(REPORT_TOP))
+        self._write(out, self.top(), indent=False)
+
+    @staticmethod
+    def _write(out, records, indent):
+        out.write('{0:>10} {1:>10} {2:>10}  {3:<8} {4}\n'.format('wall ms', 'self ms', 'mem KB', 'kind', 'name'))
+        for r in records:
+            out.write('{0:>10.1f} {1:>10.1f} {2:>10d}  {3:<8} {4}{5}\n'.format(
+                r['wall'] * 1000, r['self'] * 1000, r['memory'] // 1024, r['kind'],
+                '  ' * r['depth'] if indent else '', r['name']))
+
+
+PROFILER = {'profiler': None}
+
+
+def profiling_target():
+    target = os.environ.get(PROFILE_ENV, '').strip()
+    return '' if target.lower() in ('0', 'false', 'no', 'off') else target
+
+
+@contextmanager
+def startup_span(kind, name, report=False):
+    """
+    记录一段启动过程, report为真且是最外层时输出报告
+
+    :param kind: section, factory, import, model, loadapp
+    :param name: 配置段名、工厂名或模块名
+    :param report: 最外层结束时是否输出
+    :return:
+    """
+    target = profiling_target()
+    if not target:
+        yield
+        return
+    profiler = PROFILER['profiler']
+    if profiler is None:
+        if not report:
+            # Only spans inside a profiled loadapp are recorded
+            yield
+            return
+        profiler = PROFILER['profiler'] = StartupProfiler()
+    profiler.enter(kind, str(name))
+    try:
+        yield
+    finally:
+        if profiler.exit():
+            PROFILER['profiler'] = None
+            profiler.report(target)
@@ -30,10 +30,15 @@ try:
 except ImportError:
     from collections import MutableMapping as DictMixin
 from functools import partial
+from paste.deploy.converters import asbool
 
 import rpcexceptions
 from utils import as_config, import_class
+from content import set_json_encoder
+from timing import enable_timing
+from http import set_body_limits
 from log import handler_init
+from profiler import startup_span
 
 __author__ = 'terry'
 
@@ -96,7 +101,10 @@ def shell_factory(loader, global_conf, **local_conf):
             model = loader.get_app(model, global_conf=global_conf)
             mod = import_class(model, root_path)
             mod = partial(mod, **model_kwargs)
-            sh.load_model(mod, local_conf=mod_conf, global_conf=global_conf, relative_to=global_conf[FILE_PATH])
+            with startup_span('model', model):
+                sh.load_model(mod, local_conf=mod_conf, global_conf=global_conf, relative_to=global_conf[FILE_PATH])
+    # Built here, before prefork containers fork, so workers share it instead of building their own
+    sh.build_index()
     local_conf['shell'] = sh
 
     app = _load_factory(app_factory, global_conf, **local_conf)
@@ -113,11 +121,19 @@ def service_factory(loader, global_conf, **local_conf):
         return app, local_conf
 
 
-def platform_factory(loader, global_conf, **local_conf):
+def platform_init(global_conf):
+    """Process-wide settings from [DEFAULT], applied before any service is built"""
     _log_format = global_conf.get('log_format', None)
     _log_level = global_conf.get('log_level', None)
     _log_path = global_conf.get('log_path', None)
     handler_init(_log_path, _log_level, _log_format)
+    set_json_encoder(global_conf.get('json_encoder', None))
+    enable_timing(asbool(global_conf.get('timing', False)), asbool(global_conf.get('timing_header', False)))
+    set_body_limits(global_conf.get('body_spool_threshold', None), global_conf.get('body_max_size', None))
+
+
+def platform_factory(loader, global_conf, **local_conf):
+    platform_init(global_conf)
     platform = {}
     for pf in local_conf['start'].split():
         app = loader.get_app(pf, global_conf=global_conf)
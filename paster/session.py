@@ -30,7 +30,7 @@ from Cookie import SimpleCookie
 from functools import wraps, partial
 
 from wsgi import get_virtual_config_inside, Middleware, WSGIMiddleware, \
-    get_func_environ, push_environ_args, runner_return, get_self_object
+    get_func_environ, push_environ_args, compile_runner, get_self_object, mark_environ
 from utils import myException
 from log import get_logger
 
@@ -186,6 +186,8 @@ def redis_session(connection=None, connection_option='connection', expired_time=
         redis_target['session'] = CONNECTIONS[_connection_name]
 
     def _wrap(func):
+        _runner = compile_runner(func)
+
         @wraps(func)
         def _wrap_func(*args, **kwargs):
             _obj, _key = get_self_object(func, *args), None
@@ -230,9 +232,9 @@ def redis_session(connection=None, connection_option='connection', expired_time=
             if use_cache and _key:
                 ret = session.get(_key)
             if not ret:
-                ret = runner_return(func, *args, **kwargs)
+                ret = _runner(*args, **kwargs)
             if write_cache and _key:
                 session.set(_key, ret)
             return ret
-        return _wrap_func
+        return mark_environ(_wrap_func)
     return _wrap
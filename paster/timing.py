@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+#
+# Copyright (c) 2015-2018  Terry Xi
+# All Rights Reserved.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import sys
+import time
+import bisect
+import ctypes
+import ctypes.util
+import threading
+
+from content import json_encode
+
+__author__ = 'terry'
+
+
+TIMING_LOCAL_NAME = '__timing__'
+TIMING_ENVIRON_KEY = 'paster.timing'
+
+# Upper bounds in seconds, the last bucket collects everything slower
+TIMING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TIMING = {'enabled': False, 'header': False}
+
+def _monotonic_clock():
+    """
+    单调时钟, 依次尝试time.monotonic, monotonic包, libc的clock_gettime, 都不可用时退回time.time
+
+    :return: 返回秒数的函数
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    try:
+        from monotonic import monotonic
+        return monotonic
+    except (ImportError, RuntimeError):
+        pass
+    # CLOCK_MONOTONIC is 1 on Linux and the BSDs, 6 on macOS
+    clock_id = 6 if sys.platform == 'darwin' else 1
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'))
+        clock_gettime = libc.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    def monotonic():
+        ts = timespec()
+        if clock_gettime(clock_id, ctypes.byref(ts)):
+            return time.time()
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    if clock_gettime(clock_id, ctypes.byref(timespec())):
+        return time.time
+    return monotonic
+
+
+clock = _monotonic_clock()
+
+
+def enable_timing(enabled=True, header=False):
+    """
+    开启请求阶段计时
+
+    :param enabled: 是否记录各阶段耗时
+    :param header: 是否附加Server-Timing响应头
+    :return:
+    """
+    TIMING['enabled'] = bool(enabled)
+    TIMING['header'] = bool(enabled and header)
+
+
+class Histogram(object):
+    def __init__(self, buckets=TIMING_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        bounds = [str(b) for b in self.buckets] + ['+Inf']
+        return dict(count=self.count,
+                    total=self.total,
+                    max=self.max,
+                    mean=self.total / self.count if self.count else 0.0,
+                    buckets=dict(zip(bounds, self.counts)))
+
+
+class RouteStats(object):
+    def __init__(self):
+        self.latency = Histogram()
+        self.stages = {}
+
+    def observe(self, timer):
+        self.latency.observe(timer.elapsed())
+        for stage, duration in timer.stages():
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(duration)
+
+    def to_dict(self):
+        return dict(latency=self.latency.to_dict(),
+                    stages=dict([(k, v.to_dict()) for k, v in self.stages.items()]))
+
+
+TIMING_STATS = {}
+
+_stats_lock = threading.Lock()
+
+
+class RequestTimer(object):
+    """Timestamps taken at each stage boundary of one request"""
+
+    __slots__ = ('marks', 'route')
+
+    def __init__(self):
+        self.marks = [('start', clock())]
+        self.route = None
+
+    def mark(self, stage):
+        self.marks.append((stage, clock()))
+
+    def elapsed(self):
+        return self.marks[-1][1] - self.marks[0][1]
+
+    def stages(self):
+        """Duration of each stage, named by the boundary which ended it"""
+        marks = self.marks
+        return [(marks[i][0], marks[i][1] - marks[i - 1][1]) for i in range(1, len(marks))]
+
+    def server_timing(self):
+        return ', '.join(['{0};dur={1:.3f}'.format(stage, duration * 1000) for stage, duration in self.stages()])
+
+    def finish(self, route):
+        with _stats_lock:
+            if route not in TIMING_STATS:
+                TIMING_STATS[route] = RouteStats()
+            TIMING_STATS[route].observe(self)
+
+
+def start_timer(environ):
+    if not TIMING['enabled']:
+        return None
+    timer = RequestTimer()
+    environ[TIMING_ENVIRON_KEY] = timer
+    return timer
+
+
+def get_timing_stats():
+    with _stats_lock:
+        return dict([(route, stats.to_dict()) for route, stats in TIMING_STATS.items()])
+
+
+def reset_timing_stats():
+    with _stats_lock:
+        TIMING_STATS.clear()
+
+
+def timing_stats_app(environ, start_response):
+    """WSGI application reporting the aggregated per-route histograms"""
+    start_response('200 OK', [('CONTENT-TYPE', 'application/json')])
+    return [json_encode(get_timing_stats())]
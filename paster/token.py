@@ -26,8 +26,9 @@ from oauthlib import oauth2
 
 from session import BaseSession, make_session
 from wsgi import get_virtual_config_inside, Middleware, WSGIMiddleware, \
-    get_func_environ, push_environ_args, runner_return, get_self_object
+    get_func_environ, push_environ_args, compile_runner, get_self_object, mark_environ
 from utils import myException
+from http import get_request
 from log import get_logger
 
 
@@ -137,12 +138,8 @@ class TokenMiddleware(Middleware, WSGIMiddleware):
     TOKEN_LOCAL_NAME = '__token__'
 
     def get_token_env(self, context):
-        _token_env = {'in_headers': {}, 'in_urls': {}}
-        if 'REQUEST_KWARGS' in context:
-            _token_env['in_urls'] = context['REQUEST_KWARGS']
-        for k, v in [(_k, _v) for _k, _v in context.items() if _k.startswith('HTTP_')]:
-            _token_env['in_headers'][k[5:]] = v
-        return _token_env
+        request = get_request(context)
+        return {'in_headers': request.headers, 'in_urls': request.args}
 
     def process_request(self, context, start_response, token_env=None):
         _token_env = token_env
@@ -237,6 +234,8 @@ def token_session(keys, name, connection=None, connection_option='connection', e
     key_list = keys if isinstance(keys, list) else [keys]
 
     def _wrap(func):
+        _runner = compile_runner(func)
+
         @wraps(func)
         def _wrap_func(*args, **kwargs):
             # 获取Token会话入口
@@ -282,7 +281,7 @@ def token_session(keys, name, connection=None, connection_option='connection', e
             if outname:
                 kwargs[outname] = _token_info
 
-            ret = runner_return(func, *args, **kwargs)
+            ret = _runner(*args, **kwargs)
             return ret
-        return _wrap_func
+        return mark_environ(_wrap_func)
     return _wrap
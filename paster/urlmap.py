@@ -17,16 +17,18 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
-import json
 import werkzeug.http
-import urlparse
 import copy
 from paste.urlmap import URLMap as _URLMap, parse_path_expression
 from zope.mimetype import typegetter
 
-from utils import myException
-from wsgi import NotFound
-from http import is_response_wrapper
+from utils import myException, LRUCache
+from wsgi import NotFound, error_content, push_environ_args
+from timing import TIMING, TIMING_LOCAL_NAME, start_timer
+from content import json_encode, get_content_encoder, CONTENT_TYPE_JSON, CONTENT_TYPE_MSGPACK, \
+    CONTENT_TYPE_X_MSGPACK, CONTENT_TYPE_CBOR
+from http import is_response_wrapper, is_stream_content, stream_json_array, stream_ndjson, stream_raw, \
+    is_awaitable, DeferredResponse, get_request, CONTENT_TYPE_NDJSON, ASYNC_ENVIRON_KEY
 from rpcmap import URL_PATH
 from log import get_logger
 
@@ -43,7 +45,8 @@ def urlmap_factory(loader, global_conf, **local_conf):
         not_found_app = global_conf.get('not_found_app')
     if not_found_app:
         not_found_app = loader.get_app(not_found_app, global_conf=global_conf)
-    _map = URLMap(not_found_app=not_found_app)
+    cache_size = int(global_conf.get('negotiation_cache_size', NEGOTIATION_CACHE_SIZE))
+    _map = URLMap(not_found_app=not_found_app, negotiation_cache_size=cache_size)
     for path, app_name in local_conf.items():
         path = parse_path_expression(path)
         _global_conf = copy.copy(global_conf)
@@ -54,6 +57,7 @@ def urlmap_factory(loader, global_conf, **local_conf):
         _map[path] = app
         for hook in hooks:
             _map.add_hook(hook)
+    _map.build_index()
     return _map
 
 
@@ -61,17 +65,101 @@ class UnsupportedContentTypes(myException):
     """Raised when not found content-type in local environ"""
 
 
+class AsyncHandlerError(myException):
+    """Raised when a coroutine handler runs under a synchronous container"""
+
+    status_code = 500
+    error_code = 5001
+
+
 SUPPORTED_CONTENT_TYPES = [
-    'application/json',
+    CONTENT_TYPE_JSON,
     'application/xml',
+    CONTENT_TYPE_NDJSON,
 ]
 
+# Binary encodings offered only when their codec is installed
+SUPPORTED_CONTENT_TYPES.extend(mime for mime in (CONTENT_TYPE_MSGPACK, CONTENT_TYPE_X_MSGPACK, CONTENT_TYPE_CBOR)
+                               if get_content_encoder(mime))
+
+NEGOTIATION_CACHE_SIZE = 128
+
+
+class _MountNode(object):
+    __slots__ = ('children', 'mount')
+
+    def __init__(self):
+        self.children = {}
+        self.mount = None
+
+
+class MountIndex(object):
+    """Host + path-segment trie over the mounted applications.
+
+    A lookup walks one node per path segment, so its cost depends on the
+    depth of the requested path instead of the number of mounts.
+    """
+
+    def __init__(self, applications):
+        self.domains = {}
+        for (domain, app_url), app in applications:
+            root = self.domains.get(domain or None)
+            if root is None:
+                root = self.domains[domain or None] = _MountNode()
+            node = root
+            for segment in self.split(app_url):
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _MountNode()
+                node = child
+            if node.mount is None:
+                node.mount = (app, app_url)
+
+    @staticmethod
+    def split(url):
+        return url.split('/')[1:] if url else []
+
+    def lookup(self, host, port, path_info):
+        segments = None
+        # Same precedence as the sorted application list: mounts bound to
+        # a domain win over the domain-less ones.
+        for domain in (host, host + ':' + port, None):
+            root = self.domains.get(domain)
+            if root is None:
+                continue
+            if segments is None:
+                segments = self.split(path_info)
+            node, found = root, root.mount
+            for segment in segments:
+                node = node.children.get(segment)
+                if node is None:
+                    break
+                if node.mount is not None:
+                    found = node.mount
+            if found is not None:
+                return found
+        return None, None
+
 
 class URLMap(_URLMap):
-    def __init__(self, not_found_app=None):
+    def __init__(self, not_found_app=None, negotiation_cache_size=NEGOTIATION_CACHE_SIZE):
         self.hooks = set()
+        self.mount_index = None
+        self.negotiation_cache = LRUCache(negotiation_cache_size)
         super(URLMap, self).__init__(not_found_app=not_found_app)
 
+    def __setitem__(self, url, app):
+        super(URLMap, self).__setitem__(url, app)
+        self.mount_index = None
+
+    def __delitem__(self, url):
+        super(URLMap, self).__delitem__(url)
+        self.mount_index = None
+
+    def build_index(self):
+        self.mount_index = MountIndex(self.applications)
+        return self.mount_index
+
     def add_hook(self, callback):
         if callable(callback):
             self.hooks.add(callback)
@@ -83,13 +171,10 @@ class URLMap(_URLMap):
 
     def _match(self, host, port, path_info):
         """Find longest match for a given URL path."""
-        for (domain, app_url), app in self.applications:
-            if domain and domain != host and domain != host + ':' + port:
-                continue
-            if path_info == app_url or path_info.startswith(app_url + '/'):
-                return app, app_url
-
-        return None, None
+        index = self.mount_index
+        if index is None:
+            index = self.build_index()
+        return index.lookup(host, port, path_info)
 
     def _set_script_name(self, app, app_url):
         def wrap(environ, start_response):
@@ -125,31 +210,57 @@ class URLMap(_URLMap):
 
         return mime_type, app, app_url
 
-    def _content_type_strategy(self, host, port, environ):
+    def negotiate(self, environ, supported_content_types):
+        """Resolve the Accept/Content-Type headers of the request.
+
+        Returns ``((mime_type, version), content_version)``: the best Accept
+        match with its version parameter, and the version parameter of the
+        Content-Type header. Results are cached on the raw header values.
+        """
+        key = (environ.get('HTTP_ACCEPT', ''),
+               environ.get('CONTENT_TYPE', ''),
+               tuple(supported_content_types))
+        negotiated = self.negotiation_cache.get(key)
+        if negotiated is None:
+            negotiated = self._negotiate(key[0], key[1], supported_content_types)
+            self.negotiation_cache.set(key, negotiated)
+        return negotiated
+
+    @staticmethod
+    def _negotiate(accept_header, content_type, supported_content_types):
+        content_params = werkzeug.http.parse_options_header(content_type)[1]
+        accept = werkzeug.http.parse_accept_header(accept_header)
+
+        # Find the best match in the Accept header
+        mime_type, params = accept.best_match(supported_content_types), dict()
+        if mime_type:
+            for item in accept_header.split(','):
+                value, item_params = werkzeug.http.parse_options_header(item)
+                if value == mime_type:
+                    params = item_params
+                    break
+        return (mime_type, params.get('version')), content_params.get('version')
+
+    def negotiation_stats(self):
+        return self.negotiation_cache.stats()
+
+    def _content_type_strategy(self, host, port, version):
         """Check Content-Type header for API version."""
         app = None
-        params = werkzeug.http.parse_options_header(environ.get('CONTENT_TYPE', ''))[1]
-        if 'version' in params:
-            app, app_url = self._match(host, port, '/v' + params['version'])
+        if version:
+            app, app_url = self._match(host, port, '/v' + version)
             if app:
                 app = self._set_script_name(app, app_url)
 
         return app
 
-    def _accept_strategy(self, host, port, environ, supported_content_types):
+    def _accept_strategy(self, host, port, accept):
         """Check Accept header for best matching MIME type and API version."""
-        accept = werkzeug.http.parse_accept_header(environ.get('HTTP_ACCEPT', ''))
+        mime_type, version = accept
 
         app = None
-
-        # Find the best match in the Accept header
-        match = accept.best_match(supported_content_types)
-        if match:
-            mime_type, params = match[0], match[1]
-        else:
-            mime_type, params = None, dict()
-        if 'version' in params:
-            app, app_url = self._match(host, port, '/v' + params['version'])
+        if version:
+            app, app_url = self._match(host, port, '/v' + version)
             if app:
                 app = self._set_script_name(app, app_url)
 
@@ -159,7 +270,7 @@ class URLMap(_URLMap):
         mime_type, err = self.get_support_mimetype(), NotFound()
         _header = (('CONTENT-TYPE', mime_type), )
         start_response(self.get_status_code(err.status_code), list(_header), )
-        return json.dumps(dict(err_msg=str(err), err_code=err.error_code), ensure_ascii=False)
+        return json_encode(error_content(err), ensure_ascii=False)
 
     @staticmethod
     def get_support_mimetype():
@@ -173,7 +284,111 @@ class URLMap(_URLMap):
         else:
             return status_code + ' Oops'
 
+    @staticmethod
+    def _finish_timer(environ, timer, headers):
+        route = '{0} {1}{2}'.format(environ.get('REQUEST_METHOD', 'GET'),
+                                    environ.get('SCRIPT_NAME', ''),
+                                    timer.route or '*')
+        timer.finish(route)
+        if TIMING['header']:
+            headers.append(('SERVER-TIMING', timer.server_timing()))
+
+    @staticmethod
+    def _resolved(result, value, error=None):
+        """Fill result with the outcome of an awaited handler, errors as readable content"""
+        if error is not None:
+            if not isinstance(error, myException):
+                logger.error('Async handler failed: {0}'.format(error))
+                error = myException(str(error))
+                setattr(error, 'status_code', 500)
+            result.status_code = getattr(error, 'status_code', 200)
+            value = error_content(error)
+        result.content = value if value else None
+        return result
+
+    def _defer(self, environ, path_info, timer, result, result_response):
+        awaitable = result.content
+        if environ.get(ASYNC_ENVIRON_KEY):
+            def _render(value, error=None):
+                if timer:
+                    timer.mark('await')
+                return self._render(environ, path_info, timer,
+                                    self._resolved(result, value, error), result_response)
+            return DeferredResponse(awaitable, _render)
+
+        # Synchronous containers can only use results that are already available
+        done = getattr(awaitable, 'done', None)
+        if callable(done) and done():
+            try:
+                self._resolved(result, awaitable.result())
+            except Exception as e:
+                self._resolved(result, None, e)
+        else:
+            close = getattr(awaitable, 'close', None)
+            if callable(close):
+                close()
+            self._resolved(result, None, AsyncHandlerError('Coroutine handler needs an async container'))
+        return self._render(environ, path_info, timer, result, result_response)
+
+    def _render(self, environ, path_info, timer, result, result_response):
+        mime_type = typegetter.mimeTypeGuesser(name=path_info)
+        if not mime_type:
+            mime_type = self.get_support_mimetype()
+
+        def _verify_content(_result):
+            _result.content = _result.content if _result.content else []
+
+        def _get_status_code(_val):
+            status_code = str(_val.status_code)
+            return self.get_status_code(status_code)
+
+        target = result.content
+        if is_response_wrapper(target):
+            _header = set([(k.upper(), v) for k, v in target.headers.items()])
+            if 'CONTENT-TYPE' not in [k for k, v in _header]:
+                _header.add(('CONTENT-TYPE', mime_type))
+            _header = list(_header)
+            if timer:
+                self._finish_timer(environ, timer, _header)
+            result_response(_get_status_code(target), _header, )
+
+            _verify_content(target)
+            logger.debug(target.content)
+            if is_stream_content(target.content):
+                return stream_raw(target.content, json_encode)
+            return target.content
+        else:
+            stream = is_stream_content(result.content)
+            if stream and environ['best_content_type'] == CONTENT_TYPE_NDJSON:
+                mime_type = CONTENT_TYPE_NDJSON
+            _header = [('CONTENT-TYPE', mime_type)]
+
+            _verify_content(result)
+            logger.debug(result.content)
+            if stream:
+                if timer:
+                    self._finish_timer(environ, timer, _header)
+                result_response(_get_status_code(result), _header, )
+                # Encode item by item instead of materializing the whole body
+                if mime_type == CONTENT_TYPE_NDJSON:
+                    return stream_ndjson(result.content, json_encode)
+                return stream_json_array(result.content, json_encode)
+            encode = json_encode
+            if environ['best_content_type'] not in (None, mime_type):
+                # Internal callers may ask for a binary codec via Accept
+                _encode = get_content_encoder(environ['best_content_type'])
+                if _encode is not None:
+                    mime_type, encode = environ['best_content_type'], _encode
+                    _header = [('CONTENT-TYPE', mime_type)]
+            body = encode(result.content)
+            if timer:
+                timer.mark('encode')
+                self._finish_timer(environ, timer, _header)
+            result_response(_get_status_code(result), _header, )
+            return body
+
     def __call__(self, environ, start_response=None):
+        timer = start_timer(environ)
         host = environ.get('HTTP_HOST', environ.get('SERVER_NAME')).lower()
         if ':' in host:
             host, port = host.split(':', 1)
@@ -182,6 +397,8 @@ class URLMap(_URLMap):
                 port = '80'
             else:
                 port = '443'
+        if timer:
+            timer.mark('host')
 
         path_info = environ['PATH_INFO']
         path_info = self.normalize_url(path_info, False)[1]
@@ -198,35 +415,47 @@ class URLMap(_URLMap):
         supported_content_types = list(SUPPORTED_CONTENT_TYPES)
 
         mime_type, app, app_url = self._path_strategy(host, port, path_info)
+        if timer:
+            timer.mark('path_strategy')
 
         # Accept application/atom+xml for the index query of each API
         # version mount point as well as the root index
         if (app_url and app_url + '/' == path_info) or path_info == '/':
             supported_content_types.append('application/atom+xml')
 
+        accept, content_version = self.negotiate(environ, supported_content_types)
+        if timer:
+            timer.mark('negotiate')
+
         if not app:
-            app = self._content_type_strategy(host, port, environ)
+            app = self._content_type_strategy(host, port, content_version)
+            if timer:
+                timer.mark('content_type_strategy')
 
         if not mime_type or not app:
             possible_mime_type, possible_app = self._accept_strategy(
-                    host, port, environ, supported_content_types)
+                    host, port, accept)
             if possible_mime_type and not mime_type:
                 mime_type = possible_mime_type
             if possible_app and not app:
                 app = possible_app
+            if timer:
+                timer.mark('accept_strategy')
 
         if not app:
             # Didn't match a particular version, probably matches default
             app, app_url = self._match(host, port, path_info)
             if app:
                 app = self._munge_path(app, path_info, app_url)
+            if timer:
+                timer.mark('default_match')
 
         if app:
             environ['best_content_type'] = mime_type
-            if 'QUERY_STRING' in environ:
-                environ['REQUEST_KWARGS'] = dict()
-                for k, v in urlparse.parse_qs(environ['QUERY_STRING']).items():
-                    environ['REQUEST_KWARGS'][k] = v[0]
+            # Installs the REQUEST_KWARGS alias read by handlers and middleware
+            get_request(environ)
+            if timer:
+                push_environ_args(environ, TIMING_LOCAL_NAME, timer)
             environ['paster.result'] = type('ResultIO', (), {'result': None})
             logger.debug(environ)
             val = app(environ, start_response)
@@ -238,32 +467,8 @@ class URLMap(_URLMap):
                     result, result_response = environ['paster.result'].result
                 except:
                     return self.not_found(environ, start_response)
-            mime_type = typegetter.mimeTypeGuesser(name=path_info)
-            if not mime_type:
-                mime_type = self.get_support_mimetype()
-
-            def _verify_content(_result):
-                _result.content = _result.content if _result.content else []
-
-            def _get_status_code(_val):
-                status_code = str(_val.status_code)
-                return self.get_status_code(status_code)
-
-            target = result.content
-            if is_response_wrapper(target):
-                _header = set([(k.upper(), v) for k, v in target.headers.items()])
-                _header.add(('CONTENT-TYPE', mime_type))
-                result_response(_get_status_code(target), list(_header), )
-
-                _verify_content(target)
-                logger.debug(target.content)
-                return target.content
-            else:
-                _header = (('CONTENT-TYPE', mime_type), )
-                result_response(_get_status_code(result), list(_header), )
-
-                _verify_content(result)
-                logger.debug(result.content)
-                return json.dumps(result.content)
+            if is_awaitable(result.content):
+                return self._defer(environ, path_info, timer, result, result_response)
+            return self._render(environ, path_info, timer, result, result_response)
 
         return self.not_found(environ, start_response)
@@ -18,7 +18,13 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 import re
+import os.path
+import threading
+import multiprocessing
 import ConfigParser
+from collections import OrderedDict
+
+from profiler import startup_span, profiling_target
 
 __author__ = 'terry'
 
@@ -49,15 +55,120 @@ class myException(Exception):
             return '{0}: {1}'.format(self.__class__, self.string)
 
 
+class LRUCache(object):
+    """Bounded mapping dropping the least recently used entry when full."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self._data), maxsize=self.maxsize)
+
+
+def cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def worker_count(value):
+    """
+    解析进程数/线程数选项
+
+    :param value: 数量或auto(CPU核数), 空表示未配置
+    :return: 数量或None
+    """
+    if value is None or not str(value).strip():
+        return None
+    value = str(value).strip().lower()
+    if value == 'auto':
+        return cpu_count()
+    count = int(value)
+    if count < 1:
+        raise ValueError('Expected a positive number or auto, got {0}'.format(value))
+    return count
+
+
+# Parsed config files keyed by absolute path, reused while mtime and size are unchanged
+CONFIG_CACHE = {}
+# load_config results keyed by the raw options, checked against the stamps of the files they read,
+# see paster.wsgi.load_config
+CONFIG_MEMO = {}
+
+_config_lock = threading.Lock()
+
+
+def config_stamp(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+    except OSError:
+        return None
+
+
 def as_config(config_file):
     if isinstance(config_file, ConfigParser.ConfigParser):
         return config_file
+    if not isinstance(config_file, basestring):
+        config = ConfigParser.ConfigParser()
+        config.read(config_file)
+        return config
+    path = os.path.abspath(config_file)
+    stamp = config_stamp(path)
+    with _config_lock:
+        cached = CONFIG_CACHE.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
     config = ConfigParser.ConfigParser()
-    config.read(config_file)
+    config.read(path)
+    with _config_lock:
+        CONFIG_CACHE[path] = (stamp, config)
     return config
 
 
-def import_class(class_name, root_path=None):
+def clear_config_cache():
+    with _config_lock:
+        CONFIG_CACHE.clear()
+        CONFIG_MEMO.clear()
+
+
+def _profiled_import_class(class_name, root_path=None):
+    with startup_span('import', class_name):
+        return _import_class(class_name, root_path)
+
+
+def _import_class(class_name, root_path=None):
     class_name = str(class_name).split('.')
     module_name = '.'.join(class_name[0:-1])
     cls = __import__(module_name, fromlist=[class_name[-1]])
@@ -72,3 +183,7 @@ def import_class(class_name, root_path=None):
             file_path = os.path.join(root_path, _class_name + '.py')
             s = imp.load_source(class_name[-1], file_path)
             return getattr(s, class_name[-1])
+
+
+# Plain import_class unless PASTER_PROFILE_STARTUP was set when paster was imported
+import_class = _profiled_import_class if profiling_target() else _import_class
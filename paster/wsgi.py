@@ -18,15 +18,20 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 import re
+import sys
+import copy
 import inspect
+import threading
 import os.path
-from io import BytesIO
+import ConfigParser
 from functools import partial, wraps
 
 from deploy import loadapp
 from rpcmap import FILE_PATH, URL_PATH
-from utils import myException, as_config
-from content import get_default_content_type, get_content_process
+from utils import myException, as_config, config_stamp, CONFIG_MEMO
+from content import get_default_content_type
+from http import get_request
+from timing import TIMING_LOCAL_NAME, TIMING_ENVIRON_KEY
 from log import get_logger
 
 __author__ = 'terry'
@@ -53,6 +58,28 @@ class BaseException(myException):
     pass
 
 
+def error_content(err):
+    """Readable error body for an exception raised while processing a request"""
+    error_code = getattr(err, 'error_code', None)
+    if error_code:
+        return dict(err_msg=str(err), err_code=error_code)
+    else:
+        return dict(err_msg='')
+
+
+# Files read by the load_config calls running in this thread
+_config_reads = threading.local()
+
+
+def _read_config(path):
+    """as_config, recording path and its stamp for the load_config memo"""
+    path = os.path.abspath(path)
+    stamp = config_stamp(path)
+    for reads in getattr(_config_reads, 'stack', []):
+        reads.setdefault(path, stamp)
+    return as_config(path)
+
+
 def proto_load_config(name, obj, config_proto):
     obj = ''.join(obj.split('config:')[1:])
     relative_to = config_proto.relative_path()
@@ -60,9 +87,10 @@ def proto_load_config(name, obj, config_proto):
         _path = obj.split('normal:')[1]
         try:
             _path, sect = _path.split(':')
-            _obj = as_config(os.path.join(relative_to, _path))
+            _obj = _read_config(os.path.join(relative_to, _path))
             if sect.lower() == 'default':
-                config = _obj.defaults()
+                # The parser is shared through the config cache, never hand out its own dict
+                config = dict(_obj.defaults())
             else:
                 config = {}
                 for _k in _obj.options(sect):
@@ -71,7 +99,8 @@ def proto_load_config(name, obj, config_proto):
             _ret = config.get(name, '')
             return _ret
         except:
-            _ret = as_config(os.path.join(relative_to, _path))
+            # The cached parser is shared, tag a copy of it
+            _ret = copy.copy(_read_config(os.path.join(relative_to, _path)))
             setattr(_ret, '__path__', os.path.join(relative_to, os.path.dirname(_path)))
             return _ret
     else:
@@ -131,19 +160,68 @@ def parse_config_proto(name, obj, config, relative_to):
     return obj
 
 
+def _memoizable(value):
+    if isinstance(value, dict):
+        return all([_memoizable(v) for v in value.values()])
+    return value is None or isinstance(value, (basestring, int, long, float, ConfigParser.RawConfigParser))
+
+
+def _copy_config(value):
+    if isinstance(value, dict):
+        return dict([(k, _copy_config(v)) for k, v in value.items()])
+    return value
+
+
 def load_config(dict_obj, relative_to=''):
-    _config = {}
-    for k, v in dict_obj.items():
-        if isinstance(v, str):
-            _v = parse_config_proto(k, v, dict_obj, relative_to)
-            _config[k] = _v
-        else:
-            _config[k] = v
+    """
+    解析配置项中的config:/version:协议
+
+    结果按配置项缓存, 引用的文件修改后重新解析. 返回的dict是副本, 其中的ConfigParser对象共享, 只读使用
+
+    :param dict_obj: 配置项
+    :param relative_to: 相对路径的根目录
+    :return:
+    """
+    try:
+        key = (relative_to, frozenset(dict_obj.items()))
+    except TypeError:
+        key = None
+    if key is not None and key in CONFIG_MEMO:
+        reads, _config = CONFIG_MEMO[key]
+        if all([config_stamp(path) == stamp for path, stamp in reads]):
+            return _copy_config(_config)
+    if not hasattr(_config_reads, 'stack'):
+        _config_reads.stack = []
+    reads = {}
+    _config_reads.stack.append(reads)
+    try:
+        _config = {}
+        for k, v in dict_obj.items():
+            if isinstance(v, str):
+                _v = parse_config_proto(k, v, dict_obj, relative_to)
+                _config[k] = _v
+            else:
+                _config[k] = v
+    finally:
+        _config_reads.stack.pop()
+    # Values built by loadapp are rebuilt on every call, as before
+    if key is not None and _memoizable(_config):
+        CONFIG_MEMO[key] = (tuple(reads.items()), _config)
+        return _copy_config(_config)
     return _config
 
 
+class Response(object):
+    __slots__ = ('content', 'status_code')
+
+    def __init__(self, content=None, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+
 class WSGIMiddleware(object):
     middleware = {}
+    pipelines = {}
     hooks = {}
     app_name_re = re.compile('^(\[[^]]*\]).*')
 
@@ -159,6 +237,7 @@ class WSGIMiddleware(object):
             cls.middleware[_local_name] = []
         _local_config = load_config(local_config, here)
         cls.middleware[_local_name].append((cls, _global_config, _local_config, sh))
+        cls.compile_pipeline(_local_name)
         if _local_app_name not in cls.hooks:
             cls.hooks[_local_app_name] = set()
         if sh:
@@ -166,29 +245,44 @@ class WSGIMiddleware(object):
                 if callable(hook):
                     cls.hooks[_local_app_name].add(hook)
 
-        def call_factory(context=None, start_response=None, app_name=None):
-            return cls._factory(context, start_response, app_name=app_name)
-
-        call_factory_wrap = partial(call_factory, app_name=_local_app_name)
+        call_factory_wrap = partial(cls._factory, app_name=_local_app_name)
         return call_factory_wrap, cls.hooks[_local_app_name]
 
+    @classmethod
+    def compile_pipeline(cls, local_name):
+        """
+        实例化local_name下的中间件链, 请求时直接依次调用
+
+        :param local_name: [应用名]挂载路径
+        :return: [(中间件名, 调用入口)]
+        """
+        app_name = cls.app_name_re.match(local_name).groups()[0]
+        if app_name not in cls.pipelines:
+            cls.pipelines[app_name] = {}
+        # Keyed by the SCRIPT_NAME URLMap sets for this mount
+        pipeline = cls.pipelines[app_name].setdefault(local_name[len(app_name):], [])
+        middleware = cls.middleware[local_name]
+        if len(pipeline) > len(middleware):
+            del pipeline[:]
+        # Each middleware is built once, later ones wrap the chain built so far
+        for c, _conf, _local_conf, sh in middleware[len(pipeline):]:
+            c = c(sh, _conf, **_local_conf)
+            pipeline.insert(0, (c.__class__.__name__, c.__call__))
+        return pipeline
+
     @classmethod
     def _factory(cls, context, start_response=None, app_name=None):
         _start_response = start_response
-        _context = type('Response', (), {'content': None, 'status_code': 200})
-        _composite_url = app_name + context['SCRIPT_NAME']
-        for c, _conf, _local_conf, sh in cls.middleware[_composite_url][::-1]:
-            c = c(sh, _conf, **_local_conf)
-            context, _start_response = c.__call__(context, _start_response)
+        _context = Response()
+        timer = context.get(TIMING_ENVIRON_KEY)
+        for name, call in cls.pipelines[app_name][context['SCRIPT_NAME']]:
+            context, _start_response = call(context, _start_response)
+            if timer:
+                timer.mark(name)
         if isinstance(context, Exception):
             # Readable errors
-            status_code = getattr(context, 'status_code', 200)
-            error_code = getattr(context, 'error_code', None)
-            if error_code:
-                context = dict(err_msg=str(context), err_code=error_code)
-            else:
-                context = dict(err_msg='')
-            _context.status_code = status_code
+            _context.status_code = getattr(context, 'status_code', 200)
+            context = error_content(context)
         _context.content = context if context else None
         return _context, _start_response
 
@@ -218,7 +312,8 @@ class Middleware(object):
         target_name = context.get('PATH_INFO', None)
         method_name = context.get('REQUEST_METHOD', 'GET')
         if target_name and method_name:
-            kwargs = context.get('REQUEST_KWARGS', {})
+            # Request.args is cached per request and shared, callers merge the form into a copy
+            kwargs = dict(get_request(context).args)
             return target_name, method_name, kwargs
         else:
             raise BadRequest('Bad request for {0}:{1}'.format(target_name, method_name))
@@ -229,16 +324,9 @@ class Middleware(object):
         if not (_target_name == target_name and _method_name in method):
             return False, None
 
-        content_type = context.get('CONTENT_TYPE', get_default_content_type())
-        content_type = str(content_type).split()[0].strip(';')
-        request_body_size = int(context.get('CONTENT_LENGTH', 0))
-        request_body = context['wsgi.input'].read(request_body_size)
-        _content_process = get_content_process()
-        if content_type in _content_process:
-            out_kwargs = _content_process[content_type](request_body)
-            context['paster.kwargs'] = request_body
-            if isinstance(out_kwargs, dict):
-                _kwargs.update(out_kwargs)
+        request = get_request(context)
+        if request.content_process is not None and request.content_length:
+            _kwargs.update(request.form)
         _new = {}
         try:
             for arg in arg_list:
@@ -288,58 +376,28 @@ class URLMiddleware(Middleware, WSGIMiddleware):
             if not hasattr(self.handler, 'run'):
                 raise NotFound('Resource Handler not found')
             target_name, method_name, kwargs = self._get_request_info(context)
+            request = get_request(context)
+            content_type = request.content_type
+
+            def _process_request_body(url_kwargs):
+                logger.debug(content_type)
+                if request.content_process is not None and request.content_length:
+                    url_kwargs.update(request.form)
+                    return url_kwargs
 
-            content_type = context.get('CONTENT_TYPE', get_default_content_type())
-            content_type = str(content_type).split()[0].strip(';')
-            _file = None
-
-            def process_request_body():
-                def text_plain_process(rbody):
-                    global _file
-                    _file = BytesIO(rbody)
-
-                request_body_size = int(context.get('CONTENT_LENGTH', 0))
-                if 'paster.kwargs' not in context:
-                    request_body = context['wsgi.input'].read(request_body_size)
-                else:
-                    request_body = context['paster.kwargs']
-                text_plain_process(request_body)
-
-                def _process_request_body(url_kwargs):
-                    _content_process = get_content_process()
-                    # logger.debug(_content_process)
-                    logger.debug(content_type)
-                    if content_type in _content_process and request_body:
-                        out_kwargs = _content_process[content_type](request_body)
-                        if isinstance(out_kwargs, dict):
-                            url_kwargs.update(out_kwargs)
-                        return url_kwargs
-                return _process_request_body
-
-            pro_method = process_request_body()
-
-            class HeaderDict(dict):
-                def __getitem__(self, item):
-                    super(HeaderDict, self).__getitem__(str(item).lower())
-
-                def __setitem__(self, item, value):
-                    super(HeaderDict, self).__setitem__(str(item).lower(), value)
-
-            headers_env = HeaderDict()
-            for k in [key.split('HTTP_')[1] for key in context.keys() if key.startswith('HTTP_') and len(key) > 5]:
-                headers_env[k] = context['HTTP_' + k]
             push_environ_args(context,
                               URLMiddleware.METHOD_LOCAL_NAME,
                               dict(method=method_name,
-                                   file=_file,
-                                   headers=headers_env,
+                                   # Streamed bodies reach the handler through its kwargs
+                                   file=None if request.streaming else request.stream,
+                                   headers=request.headers,
                                    url=target_name))
             func_env = context.get('paster.args', {})
             cb = partial(self.handler.run,
                          target_name,
                          method_name + content_type,
                          FunctionEnviron(func_env),
-                         partial(pro_method, kwargs))
+                         partial(_process_request_body, kwargs))
             context = cb()
         return super(URLMiddleware, self).process_request(context, start_response)
 
@@ -357,10 +415,62 @@ def _get_route(key):
         return DEFAULT_ROUTES[key]
 
 
+ROUTE_ATTR = '__paster_routes__'
+
+
+def _register_routes(mod_name, obj):
+    """
+    登记模型上由route装饰的方法, 类模型按MRO查找, 函数模型登记自身
+
+    :param mod_name: 模型名
+    :param obj: 模型类或函数
+    :return:
+    """
+    if inspect.isclass(obj):
+        members, seen = [], set()
+        for klass in inspect.getmro(obj):
+            for attr, member in vars(klass).items():
+                member = getattr(member, '__func__', member)
+                if attr not in seen and inspect.isfunction(member):
+                    seen.add(attr)
+                    members.append((mod_name, attr, member))
+    else:
+        members = [(None, mod_name, obj)]
+    for _mod_name, func_name, member in members:
+        routes = getattr(member, ROUTE_ATTR, None)
+        if not routes:
+            continue
+        _update_route(_mod_name, {})
+        mod_dict = _get_route(_mod_name)
+        for _pack, url_re in routes:
+            if _pack not in mod_dict:
+                mod_dict[_pack] = {}
+            mod_dict[_pack][url_re] = (_mod_name, func_name)
+
+
 def route(url, method='GET', content_type=get_default_content_type(), class_member_name='__method__'):
     """
     路由装饰器, 将method对象绑定在__method__(类对象缓存名)属性
 
+    处理器由VirtualShell.run调用, 最后一个参数总是FunctionEnviron; 可以和其他装饰器(如gen.coroutine)任意顺序叠加:
+
+    >>> def third_party(f):
+    ...     @wraps(f)
+    ...     def wrapper(*args, **kwargs):
+    ...         return f(*args, **kwargs)
+    ...     return wrapper
+    >>> class Model(object):
+    ...     @route('/a')
+    ...     @third_party
+    ...     def a(self):
+    ...         return 'a'
+    ...     @third_party
+    ...     @route('/b')
+    ...     def b(self):
+    ...         return 'b'
+    >>> Model().a(FunctionEnviron({})), Model().b(FunctionEnviron({}))
+    ('a', 'b')
+
     :param url: url路径
     :param method: 请求方式
     :param content_type: 类型
@@ -383,31 +493,25 @@ def route(url, method='GET', content_type=get_default_content_type(), class_memb
     url_re = re.compile(url)
 
     def _wrap(func):
-        cls_name = inspect.stack()[1][3]
-        if not cls_name == '<module>':
-            mod_name = '.'.join([func.__module__, cls_name])
-            func_name = func.__name__
+        # Handlers are always called with the FunctionEnviron last, by VirtualShell.run or an outer decorator
+        _runner = compile_runner(func, with_environ=True)
+        _local_name = URLMiddleware.METHOD_LOCAL_NAME
+
+        if is_method(func):
+            @wraps(func)
+            def _wrap_func(self, *args, **kwargs):
+                setattr(self, class_member_name, args[-1].get(_local_name))
+                return _runner(self, *args, **kwargs)
         else:
-            mod_name = None
-            func_name = '.'.join([func.__module__, func.__name__])
-        _update_route(mod_name, {})
-
-        mod_dict = _get_route(mod_name)
-        for _pack in _packs:
-            if _pack not in mod_dict:
-                mod_dict[_pack] = {}
-
-            mod_dict[_pack][url_re] = (mod_name, func_name)
-
-        @wraps(func)
-        def _wrap_func(*args, **kwargs):
-            _obj = get_self_object(func, *args)
-            if _obj:
-                val = get_func_environ(args, URLMiddleware.METHOD_LOCAL_NAME)
-                setattr(_obj, class_member_name, val)
-
-            return runner_return(func, *args, **kwargs)
-        return _wrap_func
+            @wraps(func)
+            def _wrap_func(*args, **kwargs):
+                return _runner(*args, **kwargs)
+
+        # Registered by VirtualShell.load_model, which knows the owning model
+        routes = list(getattr(func, ROUTE_ATTR, []))
+        routes.extend([(_pack, url_re) for _pack in _packs])
+        setattr(_wrap_func, ROUTE_ATTR, routes)
+        return mark_environ(_wrap_func)
     return _wrap
 
 
@@ -418,10 +522,51 @@ def get_self_object(func, *args):
     return _obj
 
 
+def is_method(func):
+    """
+    装饰时判断func是否为方法(第一个参数为self), 沿__wrapped__找到被其他装饰器包装的原函数
+
+    :param func: 被装饰的函数
+    :return:
+    """
+    while getattr(func, '__wrapped__', None) is not None:
+        func = func.__wrapped__
+    try:
+        args = inspect.getargspec(func).args
+    except TypeError:
+        return False
+    return bool(args) and args[0] == 'self'
+
+
+CONFIG_NAMES = {}
+
+
+def _class_config_name(cls):
+    try:
+        return CONFIG_NAMES[cls]
+    except KeyError:
+        _name = CONFIG_NAMES[cls] = '.'.join([cls.__module__, cls.__name__])
+        return _name
+
+
+def _code_config_name(frame):
+    code = frame.f_code
+    try:
+        return CONFIG_NAMES[code]
+    except KeyError:
+        _pack = str(code.co_filename).split(VirtualShell.root_path) if VirtualShell.root_path else []
+        if len(_pack) > 1:
+            _pack = _pack[1].strip('/').strip('.py').strip('\\').replace('/', '.').replace('\\', '.')
+        else:
+            _pack = frame.f_globals.get('__name__', '')
+        _name = CONFIG_NAMES[code] = '.'.join([_pack, code.co_name])
+        return _name
+
+
 def get_virtual_config_inside(func, class_object=None):
     # Support decorator
     if class_object:
-        _name = str(class_object.__class__).split()[1].strip('>').strip("'")
+        _name = _class_config_name(class_object.__class__)
     else:
         _name = '.'.join([func.__module__, func.__name__])
 
@@ -432,15 +577,11 @@ def get_virtual_config_inside(func, class_object=None):
 
 
 def get_virtual_config(class_object=None):
-    _name = inspect.stack()[1][3]
     if class_object:
-        _name = str(class_object.__class__).split()[1].strip('>').strip("'")
+        _name = _class_config_name(class_object.__class__)
     else:
-        _pack = inspect.stack()[1][1]
-        _pack = str(_pack).split(VirtualShell.root_path)
-        if len(_pack) > 1:
-            _pack = _pack[1].strip('/').strip('.py').strip('\\').replace('/', '.').replace('\\', '.')
-        _name = '.'.join([_pack, _name])
+        # Only the caller's frame is looked at, its name is memoized per code object
+        _name = _code_config_name(sys._getframe(1))
 
     if _name in VirtualShell.config:
         return VirtualShell.config.get(_name, {})
@@ -464,13 +605,135 @@ def ignore_function_environ(d):
     return val
 
 
+# Set on the wrappers of route, redis_session and token_session, which strip the FunctionEnviron themselves
+ENVIRON_ATTR = '_paster_environ'
+
+
+def mark_environ(wrapper):
+    setattr(wrapper, ENVIRON_ATTR, True)
+    return wrapper
+
+
+def _handles_environ(func):
+    return getattr(func, ENVIRON_ATTR, False)
+
+
+def compile_runner(func, with_environ=False):
+    """
+    在装饰时确定调用约定, 返回直接调用func的入口
+
+    :param func: 被装饰的函数
+    :param with_environ: 调用时最后一个参数一定是FunctionEnviron, 不再逐次检查
+    :return:
+    """
+    if _handles_environ(func):
+        return func
+
+    if with_environ:
+        def _run(*args, **kwargs):
+            return func(*args[:-1], **kwargs)
+        return _run
+
+    def _run(*args, **kwargs):
+        if args and isinstance(args[-1], FunctionEnviron):
+            return func(*args[:-1], **kwargs)
+        return func(*args, **kwargs)
+    return _run
+
+
 def runner_return(func, *args, **kwargs):
-    if str(func.__code__).split()[2] != func.__name__:
+    if _handles_environ(func):
         return func(*args, **kwargs)
     else:
         return func(*ignore_function_environ(args), **kwargs)
 
 
+class RouteIndex(object):
+    """
+    路由索引: 纯文本URL走哈希表, 其余正则合并成少量交替表达式按序匹配, 多条路由匹配时注册在前的优先
+
+    :param routes: [(编译后的正则, 目标)], 按注册顺序
+    """
+
+    # Python 2 re supports at most 100 groups per expression
+    MAX_GROUPS = 99
+    REGEX_CHARS = set('.^$*+?{}[]\\|()')
+    UNCOMBINABLE_RE = re.compile(r'\\[1-9]|\(\?P=|\(\?[iLmsux]')
+    NAMED_GROUP_RE = re.compile(r'\(\?P<\w+>')
+
+    def __init__(self, routes):
+        self.literals = {}
+        self.patterns = []
+        seen, pending = set(), []
+        for position, (regex, target) in enumerate(routes):
+            if (regex.pattern, target) in seen:
+                continue
+            seen.add((regex.pattern, target))
+            literal = self._literal(regex.pattern)
+            if literal is not None:
+                if literal not in self.literals:
+                    self.literals[literal] = ((regex, target), position)
+            elif self.UNCOMBINABLE_RE.search(regex.pattern) or regex.groups >= self.MAX_GROUPS:
+                self._combine(pending)
+                pending = []
+                self.patterns.append((position, regex, [((regex, target), position)]))
+            else:
+                if sum([r.groups + 1 for r, t, p in pending]) + regex.groups + 1 > self.MAX_GROUPS:
+                    self._combine(pending)
+                    pending = []
+                pending.append((regex, target, position))
+        self._combine(pending)
+        # A pattern registered before a literal route wins for that URL, as in the declaration order scan
+        for literal, (route, position) in self.literals.items():
+            self.literals[literal] = (self._match(literal, position) or route, position)
+
+    def _literal(self, pattern):
+        # Without the trailing $ the route also matches longer URLs
+        if not pattern.endswith('$'):
+            return None
+        body = pattern[1:-1] if pattern.startswith('^') else pattern[:-1]
+        if self.REGEX_CHARS.intersection(body):
+            return None
+        return body
+
+    def _combine(self, routes):
+        if not routes:
+            return
+        groups, alternatives = [None], []
+        for regex, target, position in routes:
+            # Only the matching alternative matters, group names may repeat across routes
+            alternatives.append('({0})'.format(self.NAMED_GROUP_RE.sub('(', regex.pattern)))
+            groups.append(((regex, target), position))
+            groups.extend([None] * regex.groups)
+        try:
+            combined = re.compile('|'.join(alternatives))
+        except re.error:
+            for regex, target, position in routes:
+                self.patterns.append((position, regex, [((regex, target), position)]))
+            return
+        self.patterns.append((routes[0][2], combined, groups))
+
+    def _match(self, name, limit=None):
+        """First pattern route matching name, only those registered before limit when it is given"""
+        for first, regex, targets in self.patterns:
+            if limit is not None and first > limit:
+                break
+            m = regex.match(name)
+            if m:
+                # The enclosing group of the matching alternative closes last
+                route, position = targets[m.lastindex] if len(targets) > 1 else targets[0]
+                if limit is None or position < limit:
+                    return route
+                break
+        return None
+
+    def lookup(self, name):
+        found = self.literals.get(name)
+        if found is not None:
+            return found[0]
+        return self._match(name)
+
+
 class VirtualShell(object):
     config = {}
     root_path = None
@@ -478,19 +741,33 @@ class VirtualShell(object):
     def __init__(self):
         self.hook_objects = {}
         self.mapping_api = {}
+        self.route_index = None
+        self.method_cache = {}
+        self._index_lock = threading.Lock()
 
     def run(self, name, method, env, kwargs_callback):
-        if method not in self.mapping_api:
+        route_index = self.route_index
+        if route_index is None:
+            route_index = self.build_index()
+        if method not in route_index:
             raise NotFound()
-        _apis, _meth = self.mapping_api[method], None
-        for k, m in _apis:
-            mod, func = m
-            if k.match(name):
-                _meth = self._get_method(mod, func)
-                break
+        found, _meth = route_index[method].lookup(name), None
+        timer = env.get(TIMING_LOCAL_NAME)
+        if found:
+            k, target = found
+            _meth = self.method_cache.get(target)
+            if _meth is None:
+                _meth = self.method_cache[target] = self._get_method(*target)
+            if timer:
+                timer.route = k.pattern.lstrip('^').rstrip('$')
         if _meth:
             kwargs = kwargs_callback()
             kwargs = kwargs if kwargs else {}
+            if timer:
+                timer.mark('dispatch')
+                ret = _meth(env, **kwargs)
+                timer.mark('handler')
+                return ret
 
             return _meth(env, **kwargs)
         else:
@@ -514,6 +791,19 @@ class VirtualShell(object):
                 for _match, _api_args in _dict.items():
                     _map_dict.append((_match, _api_args))
 
+    def build_index(self):
+        """
+        构建路由索引, shell_factory在加载完所有模型后、fork之前调用; 之后再加载模型时在首次分发时重建
+
+        :return: 路由索引
+        """
+        with self._index_lock:
+            if self.route_index is None:
+                self.method_cache = {}
+                self.route_index = dict([(_method, RouteIndex(_apis))
+                                         for _method, _apis in self.mapping_api.items()])
+            return self.route_index
+
     def load_model(self, mod, global_conf=None, local_conf=None, relative_to=''):
         mod_name = mod.func
         mod_name = '.'.join([mod_name.__module__, mod_name.__name__])
@@ -522,6 +812,7 @@ class VirtualShell(object):
             VirtualShell.config['__default__'] = load_config(global_conf, relative_to=relative_dir)
         VirtualShell.config[mod_name] = load_config(local_conf, relative_to=relative_dir)
 
+        _register_routes(mod_name, mod.func)
         if mod_name not in self.hook_objects:
             if inspect.isclass(mod.func):
                 self.hook_objects[mod_name] = mod()
@@ -532,6 +823,8 @@ class VirtualShell(object):
         self._update_mapping(mod_name)
         # Update function mapping
         self._update_mapping(None)
+        # Built once by build_index after all models are loaded
+        self.route_index = None
 
     @property
     def hooks(self):
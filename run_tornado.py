@@ -1,16 +1,19 @@
 #!/usr/bin/env python
 # coding=utf-8
 import sys
+import signal
 import datetime
+import os
 import os.path
 import tornado.gen
 from tornado.httpserver import HTTPServer
-from tornado.wsgi import WSGIContainer
 from tornado.ioloop import IOLoop
 from functools import wraps
 
 from paster.dev.vshell import VShell
 from paster.deploy import loadapp
+from paster.container import make_container
+from paster.process import Supervisor, is_prefork, read_pidfile
 from paster.log import get_logger
 
 
@@ -61,16 +64,20 @@ class Shell(VShell):
         command = self.command('start', help_text=u"启动服务")
         command.install_argument(['-i', '--ini'], 'config', default='setting.ini', help_text=u"配置文件")
         command.install_argument(['-d', '--daemon'], 'daemon', is_bool=True, help_text=u"启动守护进程")
-        # command = self.command('restart', help_text=u"重新启动服务")
-        # command.install_argument(['-i', '--ini'], 'config', default='setting.ini', help_text=u"配置文件")
-        # command.install_argument(['-d', '--daemon'], 'daemon', is_bool=True, help_text=u"启动守护进程")
+        command.install_argument(['-p', '--pidfile'], 'pidfile', help_text=u"主进程pid文件, 平滑重启需要")
+        command = self.command('reload', help_text=u"平滑重启服务, 重新加载配置和代码")
+        command.install_argument(['-p', '--pidfile'], 'pidfile', help_text=u"主进程pid文件")
 
     def run(self):
-        def _run(_conf, _is_daemon):
+        def _run(_conf, _is_daemon, _pidfile):
             app = loadapp('config:{0}'.format(_conf), sys.platform, relative_to=here)
+            if _pidfile or is_prefork(app):
+                # workers = N | auto in any [service:] section, forked after loadapp
+                return Supervisor(app, pidfile=_pidfile).run()
             for _app, _conf in app.values():
                 _app.init()
-                container = WSGIContainer(_app)
+                # container = async (default) | executor | wsgi, per [service:] section
+                container = make_container(_app, _conf)
                 http_server = HTTPServer(container)
                 # http_server = HTTPServer(container, ssl_options={'certfile': 'foobar.crt',
                 #                                                  'keyfile': 'foobar.key'
@@ -80,11 +87,14 @@ class Shell(VShell):
         if self.has_command('start'):
             conf = self.get_argument('config')
             daemon = self.get_argument('daemon')
-            _run(conf, daemon)
-        # if self.has_command('restart'):
-        #     conf = self.get_argument('config')
-        #     daemon = self.get_argument('daemon')
-        #     _run(conf, daemon)
+            _run(conf, daemon, self.get_argument('pidfile'))
+        if self.has_command('reload'):
+            pid = read_pidfile(self.get_argument('pidfile') or '')
+            if not pid:
+                logger.error('No running supervisor, start it with --pidfile')
+                sys.exit(1)
+            # The supervisor re-executes itself and drains the old workers
+            os.kill(pid, signal.SIGHUP)
 
 if __name__ == '__main__':
     shell = Shell()
@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 # coding=utf-8
+import re
 import sys
 import os.path
+from paste.deploy.converters import asbool
 
-from utils.vshell import VShell
-from paster.deploy import loadapp
+from paster.dev.vshell import VShell
+from paster.deploy import loadservice
+from paster.utils import as_config, worker_count
 from paster.log import get_logger
 
 
@@ -21,13 +24,96 @@ default_uwsgi_path = os.path.join(here, './.uwsgi_conf')
 
 
 def get_app(app_name):
+    _app, _conf = loadservice('config:setting.ini', app_name, relative_to=here)
+    return _app
 
-    app = loadapp('config:setting.ini', sys.platform, relative_to=here)
-    for name, (_app, _conf) in app.items():
-        if name == app_name:
-            return _app
+if __name__ != '__main__':
+    application = get_app('main_ctl')
 
-application = get_app('main_ctl')
+
+# [service:] option -> uwsgi option, numbers accept auto (CPU count) where it makes sense
+VASSAL_OPTIONS = [
+    ('processes', 'processes', worker_count),
+    ('threads', 'threads', worker_count),
+    ('listen_backlog', 'listen', int),
+    ('buffer_size', 'buffer-size', int),
+    ('harakiri', 'harakiri', int),
+    ('offload_threads', 'offload-threads', worker_count),
+]
+
+
+def get_services(setting_path):
+    """
+    不加载应用, 直接从配置读取当前平台启动的[service:]
+
+    :param setting_path: setting.ini路径
+    :return: [(服务名, 服务配置)]
+    """
+    config = as_config(setting_path)
+    platform = 'platform:{0}'.format(sys.platform)
+    if not config.has_section(platform):
+        platform = 'pf:{0}'.format(sys.platform)
+    defaults = config.defaults()
+    services = []
+    for name in config.get(platform, 'start').split():
+        section = 'service:{0}'.format(name)
+        # [DEFAULT] keys are global settings, not options of the service, as in the loader
+        conf = dict([(option, config.get(section, option)) for option in config.options(section)
+                     if option not in defaults])
+        conf.setdefault('address', '127.0.0.1')
+        conf['port'] = conf.pop('listen', '8000')
+        services.append((name, conf))
+    return services
+
+
+def vassal_options(conf):
+    """
+    由服务配置生成uwsgi调优选项
+
+    :param conf: 服务配置
+    :return: [(uwsgi选项, 值)]
+    """
+    options = []
+    if conf.get('uwsgi') == 'auto':
+        # One process per core, preloaded in the master and shared copy-on-write
+        conf = dict(conf)
+        conf.setdefault('processes', 'auto')
+        conf.setdefault('offload_threads', 'auto')
+    for key, option, convert in VASSAL_OPTIONS:
+        value = conf.get(key)
+        if value is not None and str(value).strip():
+            options.append((option, convert(value)))
+    if dict(options).get('threads'):
+        options.append(('enable-threads', 'true'))
+    if 'lazy_apps' in conf:
+        options.append(('lazy-apps', 'true' if asbool(conf['lazy_apps']) else 'false'))
+    return options
+
+
+def render_vassal(template, name, conf):
+    options = vassal_options(conf)
+    data = template.format(address=conf['address'], port=conf['port'], name=name, **dict(
+        [(option.replace('-', '_'), value) for option, value in options]))
+    # Options the template already sets win over the generated ones
+    lines = ['{0} = {1}'.format(option, value) for option, value in options
+             if not re.search(r'^\s*{0}\s*='.format(re.escape(option)), data, re.M)]
+    if not lines:
+        return data
+    if re.search(r'^\s*\[uwsgi\]\s*$', data, re.M):
+        return re.sub(r'^(\s*\[uwsgi\]\s*)$', lambda m: '\n'.join([m.group(1)] + lines), data, count=1, flags=re.M)
+    return '\n'.join([data.rstrip('\n'), '[uwsgi]'] + lines) + '\n'
+
+
+def print_topology(services):
+    print('{0:<16} {1:<22} {2:>9} {3:>7} {4:>7} {5:>8}'.format(
+        'service', 'listen', 'processes', 'threads', 'workers', 'mode'))
+    for name, conf in services:
+        options = dict(vassal_options(conf))
+        processes = options.get('processes', 1)
+        threads = options.get('threads', 1)
+        mode = 'lazy' if options.get('lazy-apps') == 'true' else 'preload'
+        print('{0:<16} {1:<22} {2:>9} {3:>7} {4:>7} {5:>8}'.format(
+            name, '{0}:{1}'.format(conf['address'], conf['port']), processes, threads, processes * threads, mode))
 
 
 def process_conf(app_path, init_path, name, data):
@@ -42,19 +128,17 @@ root = os.path.join(here, '..')
 
 sys.path.insert(0, root)
 
-from paster.deploy import loadapp
+from paster.deploy import loadservice
 from paster.log import get_logger
 
 logger = get_logger(__name__)
 
 
 def get_app(app_name):
-
-    app = loadapp('config:setting.ini', sys.platform, relative_to=root)
-    for name, (_app, _conf) in app.items():
-        if name == app_name:
-            _app.init()
-            return _app
+    # Only the [service:] section this vassal serves is built
+    _app, _conf = loadservice('config:setting.ini', app_name, relative_to=root)
+    _app.init()
+    return _app
 
 application = get_app('{service_name}')
     """
@@ -68,6 +152,7 @@ class Shell(VShell):
         command = self.command('start', help_text=u"启动服务")
         command.install_argument(['-i', '--ini'], 'config', default='uwsgi.ini', help_text=u"配置文件")
         command.install_argument(['-d', '--daemon'], 'daemon', is_bool=True, help_text=u"启动守护进程")
+        command.install_argument(['-n', '--dry-run'], 'dry_run', is_bool=True, help_text=u"只打印进程拓扑, 不生成配置和启动")
         # command = self.command('restart', help_text=u"重新启动服务")
         # command.install_argument(['-i', '--ini'], 'config', default='setting.ini', help_text=u"配置文件")
         # command.install_argument(['-d', '--daemon'], 'daemon', is_bool=True, help_text=u"启动守护进程")
@@ -80,18 +165,18 @@ class Shell(VShell):
             f = open(conf, 'r')
             data = f.read()
 
+            services = get_services(os.path.join(here, 'setting.ini'))
+            if self.get_argument('dry_run'):
+                return print_topology(services)
+
             def run_uwsgi(is_daemon=True):
                 if not os.path.exists(default_uwsgi_path):
                     os.mkdir(default_uwsgi_path)
 
-                app = loadapp('config:setting.ini', sys.platform, relative_to=here)
-                for name, (_app, _conf) in app.items():
-                    new_data = data.format(address=_conf['address'],
-                                           port=_conf['port'],
-                                           name=name)
+                for name, _conf in services:
                     process_conf(os.path.join(default_uwsgi_path, name + '.py'),
                                  os.path.join(default_uwsgi_path, name + '.ini'),
-                                 name, new_data)
+                                 name, render_vassal(data, name, _conf))
 
                 cmd = "uwsgi --emperor {0}".format(default_uwsgi_path)
                 os.system(cmd)